@@ -127,8 +127,6 @@ def question_4():
     # Null values to be filled with 0.
 
     qry = """
-    -- Note: The implementation of the timezone query faced execution challenges and has not been integrated at this time.
-
     -- Create table that summarizes the number of repayments and total amount paid each month that each customer pays.
     CREATE TABLE timeline(
         CustomerID INTEGER,
@@ -150,8 +148,8 @@ def question_4():
     LEFT JOIN 
        repayments AS r
            ON c.CustomerID = r.CustomerID
-           AND m.MonthID = MONTH(r.RepaymentDate) 
-           AND HOUR(r.RepaymentDate) BETWEEN 6 AND 18  -- Include only payments made between 6 AM and 6 PM
+           AND m.MonthID = r.MonthID  -- Month of the payment in London time, resolved when loading the database
+           AND r.LondonHour BETWEEN 6 AND 18  -- Include only payments made between 6 AM and 6 PM London time
     GROUP BY 
         c.CustomerID, m.MonthID, m.MonthName
     ORDER BY 
@@ -1,37 +1,34 @@
 import duckdb
+import hashlib
+import json
 import os
-import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Delete the existing loan.db if it exists
 database_path = os.path.join(os.path.dirname(__file__), 'loan.db')
-if os.path.exists(database_path):
-    os.remove(database_path)
-cursor = duckdb.connect(database_path)
 
- 
+# Typed Parquet copies of the csv files, so that a rebuild does not parse the csv again
+staging_dir = os.path.join(os.path.dirname(__file__), '.cache', 'staging')
+
+
 def data_file_path(filename):
     "function to get correct path to data files"
     data_dir = os.path.join(os.path.dirname(__file__),'data')
     return os.path.join(data_dir, filename)
 
 
-
-
-loan_qry = """CREATE TABLE loans AS SELECT * FROM read_csv(?, header=True, columns = {
+# Source file and column types of every table in loan.db
+TABLES = {
+    'loans': ('loan_dataset.csv', {
                'CustomerID':'INTEGER',
                'LoanAmount':'INTEGER',
                'LoanTerm':'INTEGER',
                'InterestRate':'FLOAT',
                'ApprovalStatus':'STRING'
-               })"""
-
-cursor.execute(loan_qry, [data_file_path('loan_dataset.csv')])
-
-
-
-
-
-customer_qry = """CREATE TABLE customers AS SELECT * FROM read_csv(?, header=True, columns = {
+               }),
+    'customers': ('customer_data.csv', {
                'CustomerID':'INTEGER',
                'Name':'STRING',
                'Surname':'STRING',
@@ -39,50 +36,543 @@ customer_qry = """CREATE TABLE customers AS SELECT * FROM read_csv(?, header=Tru
                'Gender':'STRING',
                'Income':'INTEGER',
                'Region':'STRING'
-               })"""
-
-cursor.execute(customer_qry, [data_file_path('customer_data.csv')])
-
-
-
-
-credit_qry = """CREATE TABLE credit AS SELECT * FROM read_csv(?, header=True, columns = {
+               }),
+    'credit': ('credit_data.csv', {
                'CustomerID':'INTEGER',
                'CreditScore':'INTEGER',
                'CustomerClass':'STRING'
-               })"""
-
-cursor.execute(credit_qry, [data_file_path('credit_data.csv')])
-
-
-
-
-repayment_qry = """CREATE TABLE repayments AS SELECT * FROM read_csv(?, header=True, columns = {
+               }),
+    'repayments': ('Loan_Repayments.csv', {
                'RepaymentID':'INTEGER',
                'RepaymentDate':'TIMESTAMP',
                'Amount':'INTEGER',
                'CustomerID':'INTEGER',
                'TimeZone' : 'String'
-               })"""
-
-cursor.execute(repayment_qry, [data_file_path('Loan_Repayments.csv')])
-
-
-
-
-months_qry = """CREATE TABLE months AS SELECT * FROM read_csv(?, header=True, columns = {
+               }),
+    'months': ('Months.csv', {
                'MonthID':'INTEGER',
                'MonthName':'STRING',
-               })"""
-
-cursor.execute(months_qry, [data_file_path('Months.csv')])
-
-
-
-
-cursor.close()
-
-
-
-
-
+               }),
+}
+
+# Tables whose source csv only ever grows by appending rows with a new, increasing key
+APPEND_ONLY_KEYS = {'repayments': 'RepaymentID'}
+
+# Time zone of each abbreviation in the 'TimeZone' column of the repayments, loaded into the 'time_zones' table.
+# The abbreviations follow Java's short zone IDs (where 'PNT' comes from), in which EST and MST are fixed offsets.
+TIME_ZONES = {
+    'AST': 'America/Anchorage',
+    'CET': 'CET',
+    'CST': 'America/Chicago',
+    'EET': 'EET',
+    'EST': 'Etc/GMT+5',
+    'GMT': 'GMT',
+    'IST': 'Asia/Kolkata',
+    'JST': 'Asia/Tokyo',
+    'MST': 'Etc/GMT+7',
+    'PNT': 'America/Phoenix',
+    'PST': 'America/Los_Angeles',
+    'UTC': 'UTC',
+}
+
+# Resolves the local 'RepaymentDate' of every repayment once at load time, so that queries compare plain columns:
+# the UTC and London time of the repayment, the hour in London and the month in London
+repayment_times_qry = """SELECT
+               * EXCLUDE (RepaymentInstant),
+               timezone('UTC', RepaymentInstant) AS RepaymentDateUTC,
+               timezone('Europe/London', RepaymentInstant) AS RepaymentDateLondon,
+               CAST(HOUR(timezone('Europe/London', RepaymentInstant)) AS INTEGER) AS LondonHour,
+               CAST(MONTH(timezone('Europe/London', RepaymentInstant)) AS INTEGER) AS MonthID
+           FROM (
+               SELECT
+                   r.*,
+                   CASE
+                       WHEN tz.TimeZoneName IS NULL THEN error('Unknown time zone ' || r.TimeZone)
+                       ELSE timezone(tz.TimeZoneName, r.RepaymentDate)
+                   END AS RepaymentInstant
+               FROM
+                   {source} AS r
+               LEFT JOIN
+                   time_zones AS tz
+                       ON r.TimeZone = tz.TimeZone
+           )"""
+
+# Tables with columns derived from their source columns while loading
+DERIVED_COLUMNS = {'repayments': repayment_times_qry}
+
+# Physical layout of each table: the primary key, the sort order, so that the min/max zone maps of the row groups
+# prune filters and joins on CustomerID, and the ART indexes for point lookups.
+# CustomerID repeats in customers, loans and credit (see 'SQL.question_1()'), so it is indexed but not a key there.
+TABLE_LAYOUT = {
+    'loans': {'sort': ['CustomerID'], 'indexes': [['CustomerID']]},
+    'customers': {'sort': ['CustomerID'], 'indexes': [['CustomerID']]},
+    'credit': {'sort': ['CustomerID'], 'indexes': [['CustomerID']]},
+    'repayments': {'primary_key': ['RepaymentID'], 'sort': ['CustomerID', 'RepaymentDate'], 'indexes': [['CustomerID']]},
+    'months': {'primary_key': ['MonthID'], 'sort': ['MonthID']},
+}
+
+
+metadata_qry = """CREATE TABLE IF NOT EXISTS load_metadata(
+               TableName VARCHAR PRIMARY KEY,
+               SourceFile VARCHAR,
+               SourceSize BIGINT,
+               SourceMtime BIGINT,
+               SourceHash VARCHAR,
+               SchemaJson VARCHAR,
+               RowCount BIGINT,
+               ContentHash VARCHAR,
+               StorageSignature VARCHAR
+               )"""
+
+
+# Tables derived from the loaded tables that the loader keeps up to date, registered with 'register_maintained()'
+maintained_qry = """CREATE TABLE IF NOT EXISTS maintained_tables(
+               Name VARCHAR PRIMARY KEY,
+               Tables VARCHAR,
+               DependsOn VARCHAR,
+               AppendSource VARCHAR,
+               BuildSql VARCHAR,
+               RefreshSql VARCHAR
+               )"""
+
+# Tables of loan.db besides the loaded ones that belong to the loader itself
+LOADER_TABLES = {'load_metadata', 'time_zones', 'maintained_tables'}
+
+
+def select_sql(table, source):
+    "function to get the query that selects a table's rows, derived columns included, from its source columns"
+    return DERIVED_COLUMNS.get(table, 'SELECT * FROM {source}').format(source=source)
+
+
+def table_signature(table):
+    "function to get everything besides the source file that determines the contents of a table"
+    filename, columns = TABLES[table]
+    signature = {'columns': columns, 'derived': DERIVED_COLUMNS.get(table), 'layout': TABLE_LAYOUT.get(table)}
+    if table == 'repayments':
+        signature['time_zones'] = TIME_ZONES
+    return json.dumps(signature)
+
+
+def load_time_zones(cursor):
+    "function to (re)create the 'time_zones' lookup table"
+    values = ', '.join(f"({sql_string(abbreviation)}, {sql_string(name)})" for abbreviation, name in TIME_ZONES.items())
+    cursor.execute(f"""CREATE OR REPLACE TABLE time_zones AS
+                       SELECT * FROM (VALUES {values}) AS t(TimeZone, TimeZoneName)""")
+
+
+def sql_string(value):
+    "function to quote a file path as a SQL string literal"
+    return "'" + value.replace("'", "''") + "'"
+
+
+def read_csv_sql(path, columns):
+    "function to get the read_csv table function for a csv file with the given column types"
+    column_types = ',\n               '.join(f"'{name}':'{dtype}'" for name, dtype in columns.items())
+    return f"""read_csv({sql_string(path)}, header=True, columns = {{
+               {column_types}
+               }})"""
+
+
+def file_sha256(path, limit=None, chunk_size=1 << 20):
+    "function to hash the contents of a file, or only its first 'limit' bytes"
+    digest = hashlib.sha256()
+    remaining = os.path.getsize(path) if limit is None else limit
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def table_content_hash(cursor, table, where=''):
+    "function to get an order independent hash of every row of a table, used to detect changes made inside the database"
+    return str(cursor.execute(f"SELECT COALESCE(SUM(hash(t)), 0) FROM {table} AS t {where}").fetchone()[0])
+
+
+def table_storage_signature(cursor, table):
+    """
+        Fingerprints how a table is stored, without reading its rows: the row count and the block, row count,
+        statistics and pending updates of every column segment. Inserts, deletes and updates change the row count or
+        the segments, checkpointed or not, so the signature is compared first and the rows are only hashed when it
+        differs. A checkpoint can also move unchanged segments, which then costs one content hash.
+
+        Args:
+            cursor: DuckDB connection
+            table (str): Name of the table
+
+        Returns:
+            str: The signature
+
+    """
+    n_rows = cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    segments = cursor.execute(f"SELECT * FROM pragma_storage_info({sql_string(table)})").fetchall()
+    return hashlib.sha256(repr((n_rows, segments)).encode()).hexdigest()
+
+
+def source_fingerprint(path, recorded=None):
+    "function to fingerprint a source file, reusing the recorded hash when its size and modification time are unchanged"
+    stat = os.stat(path)
+    if recorded and recorded['SourceSize'] == stat.st_size and recorded['SourceMtime'] == stat.st_mtime_ns:
+        return {'SourceSize': stat.st_size, 'SourceMtime': stat.st_mtime_ns, 'SourceHash': recorded['SourceHash']}
+    return {'SourceSize': stat.st_size, 'SourceMtime': stat.st_mtime_ns, 'SourceHash': file_sha256(path)}
+
+
+def read_metadata(cursor):
+    "function to get the recorded fingerprint of every loaded table"
+    cursor.execute(metadata_qry)
+    # Databases loaded before the storage signature was recorded fall back to the content hash once
+    cursor.execute("ALTER TABLE load_metadata ADD COLUMN IF NOT EXISTS StorageSignature VARCHAR")
+    result = cursor.execute("SELECT * FROM load_metadata")
+    names = [column[0] for column in result.description]
+    return {row[0]: dict(zip(names, row)) for row in result.fetchall()}
+
+
+def write_metadata(cursor, table, filename, fingerprint):
+    "function to record the fingerprint of a loaded table"
+    cursor.execute("DELETE FROM load_metadata WHERE TableName = ?", [table])
+    cursor.execute("INSERT INTO load_metadata VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        table, filename, fingerprint['SourceSize'], fingerprint['SourceMtime'], fingerprint['SourceHash'],
+        table_signature(table), cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0],
+        table_content_hash(cursor, table), table_storage_signature(cursor, table)])
+
+
+def register_maintained(cursor, name, tables, depends_on, build, refresh=(), append_source=None):
+    """
+        Registers tables derived from the loaded tables, so that loading loan.db keeps them instead of dropping them.
+        They are rebuilt after any table they depend on is rebuilt, and refreshed from the appended rows, in the
+        same transaction as the append, when only their append source grew.
+
+        Args:
+            cursor: DuckDB connection to loan.db
+            name (str): Name of the group of maintained tables
+            tables (list): The maintained tables
+            depends_on (list): Loaded tables the maintained tables are computed from
+            build (list): SQL statements that (re)create the maintained tables
+            refresh (list): SQL statements that update the maintained tables from the rows appended to the
+                            'append_source' table, which they read from the temporary table 'new_<append_source>'
+            append_source (str): Append-only table whose new rows are applied with 'refresh' (default is None,
+                                 an append then rebuilds the maintained tables)
+
+    """
+    cursor.execute(maintained_qry)
+    cursor.execute("DELETE FROM maintained_tables WHERE Name = ?", [name])
+    cursor.execute("INSERT INTO maintained_tables VALUES (?, ?, ?, ?, ?, ?)", [
+        name, json.dumps(list(tables)), json.dumps(list(depends_on)), append_source, json.dumps(list(build)),
+        json.dumps(list(refresh))])
+
+
+def read_maintained(cursor):
+    "function to get the registered groups of maintained tables"
+    cursor.execute(maintained_qry)
+    rows = cursor.execute("SELECT * FROM maintained_tables").fetchall()
+    return {name: {'tables': json.loads(tables), 'depends_on': json.loads(depends_on), 'append_source': append_source,
+                   'build': json.loads(build), 'refresh': json.loads(refresh)}
+            for name, tables, depends_on, append_source, build, refresh in rows}
+
+
+def run_statements(cursor, statements):
+    "function to run SQL statements in a single transaction"
+    cursor.begin()
+    try:
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.commit()
+    except Exception:
+        cursor.rollback()
+        raise
+
+
+def staged_path(table, fingerprint, columns):
+    "function to get the path of the Parquet copy of a source csv, named after its contents and column types"
+    key = hashlib.sha256((fingerprint['SourceHash'] + json.dumps(columns)).encode()).hexdigest()[:16]
+    return os.path.join(staging_dir, f'{table}-{key}.parquet')
+
+
+def stage_table(cursor, table, path, columns, fingerprint):
+    """
+        Converts a source csv to a typed Parquet file once, later rebuilds of the same csv reuse it.
+
+        Args:
+            cursor: DuckDB connection
+            table (str): Name of the table the csv is loaded into
+            path (str): Path of the source csv file
+            columns (dict): Column types of the table
+            fingerprint (dict): Fingerprint of the source csv from the 'source_fingerprint()' function
+
+        Returns:
+            str: Path of the Parquet file
+
+    """
+    parquet_path = staged_path(table, fingerprint, columns)
+    if os.path.exists(parquet_path):
+        return parquet_path
+
+    # Write to a temporary file and swap it into place once complete, then remove copies of older versions of the csv
+    os.makedirs(staging_dir, exist_ok=True)
+    tmp_path = parquet_path + '.tmp'
+    cursor.execute(f"COPY (SELECT * FROM {read_csv_sql(path, columns)}) TO {sql_string(tmp_path)} (FORMAT PARQUET)")
+    os.replace(tmp_path, parquet_path)
+    for filename in os.listdir(staging_dir):
+        if filename.startswith(f'{table}-') and os.path.join(staging_dir, filename) != parquet_path:
+            os.remove(os.path.join(staging_dir, filename))
+    return parquet_path
+
+
+def create_table(cursor, table, source, layout=True):
+    """
+        Creates (or recreates) a table from a relation of its source columns, in a single transaction.
+
+        Args:
+            cursor: DuckDB connection
+            table (str): Name of the table
+            source (str): Table, table function or subquery with the source columns of the table
+            layout (bool): Declare the primary key, sort the rows and create the indexes of 'TABLE_LAYOUT',
+                           rather than keep the rows in source order (default is True)
+
+    """
+    qry = select_sql(table, source)
+    spec = TABLE_LAYOUT.get(table, {}) if layout else {}
+
+    cursor.begin()
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        if not spec:
+            cursor.execute(f"CREATE TABLE {table} AS {qry}")
+        else:
+            # Declare the table from the columns of the query, as constraints cannot be added to an existing table
+            definitions = [f'"{name}" {dtype}' for name, dtype, *_ in cursor.execute(f"DESCRIBE {qry}").fetchall()]
+            if spec.get('primary_key'):
+                definitions.append(f"PRIMARY KEY ({', '.join(spec['primary_key'])})")
+            cursor.execute(f"CREATE TABLE {table} ({', '.join(definitions)})")
+            cursor.execute(f"INSERT INTO {table} BY NAME {qry} ORDER BY {', '.join(spec.get('sort', ['ALL']))}")
+
+            # Indexes are built once the rows are in, rather than maintained row by row
+            for columns in spec.get('indexes', []):
+                cursor.execute(f"CREATE INDEX {table}_{'_'.join(columns)}_idx ON {table} ({', '.join(columns)})")
+        cursor.commit()
+    except Exception:
+        cursor.rollback()
+        raise
+
+
+def rebuild_table(cursor, table, path, columns, fingerprint):
+    "function to (re)create a table from the Parquet copy of its source csv file"
+    parquet_path = stage_table(cursor, table, path, columns, fingerprint)
+    create_table(cursor, table, f"read_parquet({sql_string(parquet_path)})")
+
+
+def append_rows(cursor, table, path, columns, key, loaded_size, refresh=None):
+    """
+        Inserts the rows appended to a source csv file since it was last loaded, parsing only the new bytes.
+        The maintained tables to refresh are updated from the new rows in the same transaction.
+
+        Args:
+            cursor: DuckDB connection to loan.db
+            table (str): Name of the table to append to
+            path (str): Path of the source csv file
+            columns (dict): Column types of the table
+            key (str): Increasing key column, rows with a key already in the table are skipped
+            loaded_size (int): Size in bytes of the source file when it was last loaded
+            refresh (dict): Refresh statements of each group of maintained tables to update (default is none)
+
+        Returns:
+            dict: Seconds taken to refresh each group of maintained tables
+
+    """
+    # Copy the header and the appended bytes into a temporary csv file
+    with open(path, 'rb') as source, tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as tail:
+        tail.write(source.readline())
+        source.seek(loaded_size)
+        tail.write(source.read())
+    seconds = {}
+    try:
+        source = f"""(SELECT * FROM {read_csv_sql(tail.name, columns)}
+                      WHERE {key} > (SELECT COALESCE(MAX({key}), 0) FROM {table}))"""
+        cursor.begin()
+        try:
+            # Keep the new rows apart for the refresh statements of the maintained tables
+            cursor.execute(f"CREATE OR REPLACE TEMP TABLE new_{table} AS {select_sql(table, source)}")
+            cursor.execute(f"INSERT INTO {table} BY NAME SELECT * FROM new_{table}")
+            for name, statements in (refresh or {}).items():
+                start = time.perf_counter()
+                for statement in statements:
+                    cursor.execute(statement)
+                seconds[name] = time.perf_counter() - start
+            cursor.execute(f"DROP TABLE new_{table}")
+            cursor.commit()
+        except Exception:
+            cursor.rollback()
+            raise
+    finally:
+        os.remove(tail.name)
+    return seconds
+
+
+def is_append(path, recorded, fingerprint):
+    "function to check whether a source file only grew by whole lines since it was last loaded"
+    loaded_size = recorded['SourceSize']
+    if fingerprint['SourceSize'] <= loaded_size or loaded_size == 0:
+        return False
+    with open(path, 'rb') as f:
+        f.seek(loaded_size - 1)
+        if f.read(1) != b'\n':
+            return False
+    return file_sha256(path, limit=loaded_size) == recorded['SourceHash']
+
+
+def load_table(cursor, table, action, fingerprint, recorded, refresh=None):
+    "function to run the action planned for one table on its own cursor, returning the time it and each refresh took"
+    filename, columns = TABLES[table]
+    start = time.perf_counter()
+    refreshed = {}
+    if action == 'appended':
+        refreshed = append_rows(cursor, table, data_file_path(filename), columns, APPEND_ONLY_KEYS[table],
+                                recorded['SourceSize'], refresh)
+    else:
+        rebuild_table(cursor, table, data_file_path(filename), columns, fingerprint)
+    return time.perf_counter() - start, refreshed
+
+
+def load_database(full=False, workers=None):
+    """
+        Brings loan.db up to date with the csv files in the 'data' folder.
+        Tables are only rebuilt when their source file, column types or contents inside the database changed,
+        the contents being checked through 'table_storage_signature()' so that a run with nothing to do does not
+        read the tables, and rows appended to an append-only source are inserted without rebuilding the table.
+        Tables are loaded concurrently, each on its own cursor, so small tables do not wait behind 'repayments'.
+        Maintained tables registered with 'register_maintained()' are refreshed from appended rows, or rebuilt once
+        every table is loaded when a table they depend on was rebuilt.
+
+        Args:
+            full (bool): Delete loan.db and rebuild every table, maintained tables included (default is False)
+            workers (int): Number of tables loaded at the same time (default is all of them)
+
+        Returns:
+            dict: The action taken for every table ('unchanged', 'appended' or 'rebuilt') and group of maintained
+                  tables ('unchanged', 'refreshed' or 'rebuilt') and the seconds it took
+
+    """
+    # Delete the existing loan.db when a full rebuild is requested, remembering the maintained tables to rebuild
+    maintained = {}
+    if full and os.path.exists(database_path):
+        with duckdb.connect(database_path) as cursor:
+            maintained = read_maintained(cursor)
+        os.remove(database_path)
+
+    with duckdb.connect(database_path) as cursor:
+        metadata = read_metadata(cursor)
+        for name, entry in maintained.items():
+            register_maintained(cursor, name, **entry)
+        maintained = read_maintained(cursor)
+        kept = {table for entry in maintained.values() for table in entry['tables']}
+        existing = {row[0] for row in cursor.execute(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = 'main'").fetchall()}
+
+        # Drop tables and views created by the questions, so that the database is back to its loaded state
+        for table in existing - set(TABLES) - LOADER_TABLES - kept:
+            kind = cursor.execute("SELECT table_type FROM information_schema.tables WHERE table_name = ?",
+                                  [table]).fetchone()[0]
+            cursor.execute(f"DROP {'VIEW' if kind == 'VIEW' else 'TABLE'} IF EXISTS {table}")
+
+        load_time_zones(cursor)
+
+        # Plan the action of every table
+        plan = {}
+        moved = []
+        for table, (filename, _) in TABLES.items():
+            path = data_file_path(filename)
+            recorded = metadata.get(table)
+            fingerprint = source_fingerprint(path, recorded)
+
+            # The table must have been loaded with the same column types and still hold what was loaded
+            intact = recorded is not None and table in existing and recorded['SchemaJson'] == table_signature(table)
+            if intact and recorded['StorageSignature'] != table_storage_signature(cursor, table):
+                # Only hash the rows when the storage changed, which a checkpoint can also do to an intact table
+                intact = recorded['ContentHash'] == table_content_hash(cursor, table)
+                if intact:
+                    moved.append(table)
+
+            if intact and fingerprint['SourceHash'] == recorded['SourceHash']:
+                action = 'unchanged'
+            elif intact and table in APPEND_ONLY_KEYS and is_append(path, recorded, fingerprint):
+                action = 'appended'
+            else:
+                action = 'rebuilt'
+            plan[table] = (action, fingerprint, recorded)
+
+        # Plan the maintained tables: refreshed in the same transaction as the append when only their append source
+        # grew, otherwise rebuilt once every table is loaded if any table they depend on changed
+        maintained_plan, refresh = {}, {}
+        for name, entry in maintained.items():
+            changed = {table for table in entry['depends_on'] if plan[table][0] != 'unchanged'}
+            source = entry['append_source']
+            if not set(entry['tables']) <= existing:
+                maintained_plan[name] = 'rebuilt'
+            elif not changed:
+                maintained_plan[name] = 'unchanged'
+            elif changed == {source} and plan[source][0] == 'appended' and entry['refresh']:
+                maintained_plan[name] = 'refreshed'
+                refresh.setdefault(source, {})[name] = entry['refresh']
+            else:
+                maintained_plan[name] = 'rebuilt'
+
+        # Load the tables concurrently, largest source first so that it starts straight away
+        pending = sorted((table for table, (action, _, _) in plan.items() if action != 'unchanged'),
+                         key=lambda table: plan[table][1]['SourceSize'], reverse=True)
+        seconds = {table: 0.0 for table in plan}
+        if pending:
+            with ThreadPoolExecutor(max_workers=workers or len(pending)) as executor:
+                futures = {table: executor.submit(load_table, cursor.cursor(), table, *plan[table], refresh.get(table))
+                           for table in pending}
+                for table, future in futures.items():
+                    seconds[table], refreshed = future.result()
+                    seconds.update(refreshed)
+
+        # Record the fingerprints on the main cursor, once every table is loaded and checkpointed to its final blocks
+        if pending or moved:
+            cursor.execute("CHECKPOINT")
+        for table in pending:
+            write_metadata(cursor, table, TABLES[table][0], plan[table][1])
+        for table in moved:
+            cursor.execute("UPDATE load_metadata SET StorageSignature = ? WHERE TableName = ?",
+                           [table_storage_signature(cursor, table), table])
+
+        # Rebuild the maintained tables from the loaded tables
+        for name, action in maintained_plan.items():
+            start = time.perf_counter()
+            if action == 'rebuilt':
+                run_statements(cursor, maintained[name]['build'])
+            seconds.setdefault(name, time.perf_counter() - start)
+
+    actions = {table: {'action': plan[table][0], 'seconds': seconds[table]} for table in TABLES}
+    actions.update({name: {'action': action, 'seconds': seconds[name]} for name, action in maintained_plan.items()})
+    return actions
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    workers = next((int(arg.split('=', 1)[1]) for arg in sys.argv if arg.startswith('--workers=')), None)
+    actions = load_database(full='--full' in sys.argv, workers=workers)
+    for table, result in actions.items():
+        print(f"{table}: {result['action']} ({result['seconds']:.3f}s)")
+    print(f"loaded in {time.perf_counter() - start:.3f}s")
+
+
+
+
+
+"""
+The database loan.db consists of 3 tables:
+   1. customers - table containing customer data
+   2. loans - table containing loan data pertaining to customers
+   3. credit - table containing credit and creditscore data pertaining to customers
+   4. repayments - table containing loan repayment data pertaining to customers
+   5. months - table containing month name and month ID data
+
+You are required to make use of your knowledge in SQL to query the database object (saved as loan.db) and return the requested information.
+Simply fill in the vacant space wrapped in triple quotes per question (each function represents a question)
+
+"""
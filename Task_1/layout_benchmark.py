@@ -0,0 +1,122 @@
+import argparse
+import os
+import tempfile
+import time
+
+import duckdb
+
+import Advanced_SQL
+from database.database_load import TABLES, create_table, data_file_path, load_time_zones, read_csv_sql
+from query_executor import split_statements
+from timeline import timeline_cells_qry
+
+"""
+Benchmark of the CustomerID joins of the question functions on the raw and on the laid out loan database.
+
+The bundled csv files are replicated 'factor' times with CustomerID and RepaymentID shifted per copy, and loaded twice
+with 'database_load.create_table()': once in source order with no keys or indexes, as 'database_load.py' used to
+create the tables, and once with the primary keys, sort order and indexes of 'TABLE_LAYOUT'. The same queries are then
+timed on both databases.
+
+    python layout_benchmark.py --factor 200
+
+"""
+
+# Shift of the CustomerID and RepaymentID of each copy of the data, larger than any id in the csv files
+ID_STRIDE = 100_000
+
+
+def scaled_source(table, factor):
+    "function to get a subquery with the source columns of a table replicated 'factor' times, in csv order"
+    filename, columns = TABLES[table]
+    shifted = {'CustomerID': f'CustomerID + i * {ID_STRIDE}', 'RepaymentID': f'RepaymentID + i * {ID_STRIDE}'}
+    select_list = ', '.join(f"CAST({shifted[name]} AS INTEGER) AS {name}" if name in shifted else name
+                            for name in columns)
+    if table == 'months':
+        return f"(SELECT * FROM {read_csv_sql(data_file_path(filename), columns)})"
+
+    # Keep the csv order of the rows, with the copies of each row next to each other
+    return f"""(SELECT {select_list}
+               FROM (SELECT *, ROW_NUMBER() OVER () AS CsvRow FROM {read_csv_sql(data_file_path(filename), columns)})
+               CROSS JOIN range({int(factor)}) AS t(i)
+               ORDER BY CsvRow, i)"""
+
+
+def benchmark_queries(point_lookups=200):
+    "function to get the timed queries, as name and list of statements run one after another"
+    customer_ids = [1 + (i * 7919) % 1000 + (i % 50) * ID_STRIDE for i in range(point_lookups)]
+    return {
+        'Advanced_SQL.question_1': [Advanced_SQL.question_1()],
+        'Advanced_SQL.question_2 (SELECT)': [split_statements(Advanced_SQL.question_2())[1]],
+        'financing join (question_3)': [split_statements(Advanced_SQL.question_3())[1].split(')', 1)[1]],
+        'timeline cells (question_4)': [timeline_cells_qry()],
+        f'{point_lookups} customer lookups': [
+            f"""SELECT c.Name, c.Surname, COUNT(r.Amount), SUM(r.Amount)
+                FROM customers AS c JOIN repayments AS r ON c.CustomerID = r.CustomerID
+                WHERE c.CustomerID = {customer_id}
+                GROUP BY c.Name, c.Surname""" for customer_id in customer_ids],
+    }
+
+
+def time_queries(cursor, queries, repeat):
+    "function to get the fastest time in seconds of every query"
+    timings = {}
+    for name, statements in queries.items():
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for statement in statements:
+                cursor.execute(statement).fetchall()
+            runs.append(time.perf_counter() - start)
+        timings[name] = min(runs)
+    return timings
+
+
+def benchmark_layout(factor=200, repeat=3, threads=None, point_lookups=200):
+    """
+        Times the join queries on a replicated loan database, without and with the layout step.
+
+        Args:
+            factor (int): Number of copies of the bundled data
+            repeat (int): Number of timed runs of each query, the fastest is reported
+            threads (int): Number of DuckDB threads (default is DuckDB's own setting)
+            point_lookups (int): Number of single customer queries in the lookup benchmark
+
+        Returns:
+            dict: Seconds per query for the 'raw' and the 'layout' database
+    """
+    queries = benchmark_queries(point_lookups)
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, layout in (('raw', False), ('layout', True)):
+            cursor = duckdb.connect(os.path.join(tmp_dir, f'{name}.db'))
+            cursor.execute("SET enable_progress_bar = false")
+            if threads:
+                cursor.execute(f"SET threads = {int(threads)}")
+            load_time_zones(cursor)
+            for table in TABLES:
+                create_table(cursor, table, scaled_source(table, factor), layout=layout)
+
+            # Time the queries on a fresh connection, so that both start from the database file
+            cursor.close()
+            cursor = duckdb.connect(os.path.join(tmp_dir, f'{name}.db'))
+            if threads:
+                cursor.execute(f"SET threads = {int(threads)}")
+            timings[name] = time_queries(cursor, queries, repeat)
+            cursor.close()
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the CustomerID joins on the raw and laid out loan database")
+    parser.add_argument('--factor', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    timings = benchmark_layout(args.factor, args.repeat, args.threads, args.lookups)
+    print(f"{'query':<34}{'raw':>10}{'layout':>10}{'speedup':>10}")
+    for name in timings['raw']:
+        raw, laid_out = timings['raw'][name], timings['layout'][name]
+        print(f"{name:<34}{raw:>9.3f}s{laid_out:>9.3f}s{raw / laid_out:>9.2f}x")
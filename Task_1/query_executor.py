@@ -0,0 +1,256 @@
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+
+import duckdb
+
+"""
+Executes the question functions of 'SQL.py' and 'Advanced_SQL.py' on one shared DuckDB connection to loan.db and
+caches their results as Arrow tables.
+
+A result is cached under the normalized text of its SELECT statement together with the version of every table the
+statement reads. Statements that write to a table (UPDATE, INSERT, DELETE, CREATE, DROP, ...) bump that table's
+version, so a mutating question such as 'SQL.question_5()' or 'Advanced_SQL.question_2()' makes the cached results
+that read the table unreachable without touching the rest of the cache. The cache is bounded in bytes and evicts the
+least recently used results first.
+
+Example:
+    with QueryExecutor() as executor:
+        executor.run(Advanced_SQL.question_1)  # executed
+        executor.run(Advanced_SQL.question_1)  # served from the cache
+        executor.run(SQL.question_5)           # UPDATE credit, question_1's result is stale from now on
+
+Statements that DuckDB cannot bind on their own, read no table or read a view are run without caching.
+Only writes made through the executor are seen, call 'invalidate()' after changing loan.db in any other way
+(e.g. rerunning 'database/database_load.py').
+
+"""
+
+database_path = os.path.join(os.path.dirname(__file__), 'database', 'loan.db')
+
+# Statements whose result can be cached
+READ_STATEMENT = re.compile(r'^(SELECT|WITH|FROM|VALUES|TABLE|PIVOT|UNPIVOT)\b', re.IGNORECASE)
+
+# Statements that write to a table, capturing the name of the table
+WRITE_STATEMENT = re.compile(r"""^(?:
+        UPDATE
+        | INSERT\s+(?:OR\s+\w+\s+)?INTO
+        | DELETE\s+FROM
+        | TRUNCATE(?:\s+TABLE)?
+        | ALTER\s+TABLE
+        | DROP\s+(?:TABLE|VIEW)(?:\s+IF\s+EXISTS)?
+        | CREATE\s+(?:OR\s+REPLACE\s+)?(?:TEMP(?:ORARY)?\s+)?(?:TABLE|VIEW)(?:\s+IF\s+NOT\s+EXISTS)?
+        | COPY
+    )\s+([\w."]+)""", re.IGNORECASE | re.VERBOSE)
+
+
+def split_statements(qry):
+    """
+        Splits a SQL string into its statements, dropping comments and collapsing whitespace outside of quotes.
+
+        Args:
+            qry (str): SQL string with one or more statements separated by ';'
+
+        Returns:
+            list: The normalized text of every non-empty statement
+    """
+    statements, current, i = [], [], 0
+    while i < len(qry):
+        char = qry[i]
+        if char in ("'", '"'):
+            # Copy quoted strings and identifiers as they are
+            end = i + 1
+            while end < len(qry):
+                if qry[end] == char:
+                    if qry[end + 1:end + 2] == char:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(qry[i:end + 1])
+            i = end + 1
+        elif qry.startswith('--', i):
+            end = qry.find('\n', i)
+            i = len(qry) if end == -1 else end
+            current.append(' ')
+        elif qry.startswith('/*', i):
+            end = qry.find('*/', i + 2)
+            i = len(qry) if end == -1 else end + 2
+            current.append(' ')
+        elif char == ';':
+            statements.append(''.join(current))
+            current = []
+            i += 1
+        else:
+            current.append(' ' if char.isspace() else char)
+            i += 1
+    statements.append(''.join(current))
+    return [re.sub(r' +', ' ', statement).strip() for statement in statements if statement.strip()]
+
+
+def table_name(identifier):
+    "function to get the bare, lower case name of a possibly quoted and schema qualified table"
+    return identifier.split('.')[-1].strip('"').lower()
+
+
+class ArrowResultCache:
+    """
+        Least recently used cache of Arrow tables, bounded by their size in bytes.
+
+        Args:
+            max_bytes (int): Total size of the cached tables (default is 256 MiB)
+
+    """
+
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        "function to get a cached table, or None, marking it as the most recently used"
+        table = self._entries.get(key)
+        if table is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return table
+
+    def put(self, key, table):
+        "function to cache a table, evicting the least recently used tables until it fits"
+        if table.nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key).nbytes
+        while self._entries and self.nbytes + table.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+        self._entries[key] = table
+        self.nbytes += table.nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+class QueryExecutor:
+    """
+        Runs question functions on a shared DuckDB connection, caching their results.
+
+        Args:
+            database (str): Path of the DuckDB database (default is 'database/loan.db')
+            max_cache_bytes (int): Size limit of the result cache (default is 256 MiB)
+            read_only (bool): Open the database read only (default is False)
+
+    """
+
+    def __init__(self, database=None, max_cache_bytes=256 * 2**20, read_only=False):
+        self.database = database or database_path
+        self.cursor = duckdb.connect(self.database, read_only=read_only)
+        self.cache = ArrowResultCache(max_cache_bytes)
+        self.versions = defaultdict(int)
+        self._tables_read = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def invalidate(self, table=None):
+        "function to mark a table, or every table when none is given, as changed outside of the executor"
+        with self._lock:
+            if table is None:
+                # Cached keys hold the versions they were read at, so a fresh cache is needed for unknown changes
+                self.cache.clear()
+                self._tables_read.clear()
+            else:
+                self.versions[table_name(table)] += 1
+
+    def _cacheable_tables(self, statement):
+        """
+            Looks up the tables a read statement depends on, or None when its result must not be cached: DuckDB
+            cannot bind it on its own (e.g. 'JOIN ... USING' on DuckDB 0.9), it reads no table (e.g. a table function
+            such as 'read_parquet()') or it reads a view, whose writes go to base tables not named in the statement.
+
+            Args:
+                statement (str): Normalized read statement
+
+            Returns:
+                list: The sorted table names, or None
+        """
+        try:
+            tables = {table_name(name) for name in self.cursor.get_table_names(statement)}
+        except duckdb.Error:
+            return None
+        views = {table_name(name) for name, in self.cursor.execute(
+            "SELECT view_name FROM duckdb_views() WHERE NOT internal").fetchall()}
+        if not tables or tables & views:
+            return None
+        return sorted(tables)
+
+    def _run_statement(self, statement):
+        if READ_STATEMENT.match(statement):
+            # The tables a statement reads only depend on its text and the schema, so they are looked up once
+            # per schema, every statement that is not a read clears the lookups
+            if statement not in self._tables_read:
+                self._tables_read[statement] = self._cacheable_tables(statement)
+            tables = self._tables_read[statement]
+            if tables is None:
+                return self.cursor.execute(statement).arrow()
+            key = (statement, tuple((table, self.versions[table]) for table in tables))
+            result = self.cache.get(key)
+            if result is None:
+                result = self.cursor.execute(statement).arrow()
+                self.cache.put(key, result)
+            return result
+
+        result = self.cursor.execute(statement)
+        self._tables_read.clear()
+        write = WRITE_STATEMENT.match(statement)
+        if write:
+            self.versions[table_name(write.group(1))] += 1
+        else:
+            # Statements that are neither reads nor recognised writes could have changed anything
+            self.cache.clear()
+        try:
+            return result.arrow()
+        except duckdb.Error:
+            return None
+
+    def run(self, query):
+        """
+            Executes every statement of a question, serving cached results where the tables read are unchanged.
+
+            Args:
+                query (function or str): Question function returning a SQL string, or the SQL string itself
+
+            Returns:
+                pyarrow.Table: The result of the last statement
+        """
+        qry = query() if callable(query) else query
+        result = None
+        with self._lock:
+            for statement in split_statements(qry):
+                result = self._run_statement(statement)
+        return result
+
+    def df(self, query):
+        "function to get the result of a question as a DataFrame"
+        return self.run(query).to_pandas()
+
+    def cache_info(self):
+        "Hit, miss and eviction counts and the size of the result cache"
+        return {'hits': self.cache.hits, 'misses': self.cache.misses, 'evictions': self.cache.evictions,
+                'entries': len(self.cache), 'nbytes': self.cache.nbytes, 'max_bytes': self.cache.max_bytes}
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import duckdb
+
+import Advanced_SQL
+import SQL
+from database.database_load import database_path, sql_string
+from query_executor import split_statements
+
+"""
+Profiling runner for the question functions of 'SQL.py' and 'Advanced_SQL.py'.
+
+Every question is run statement by statement with DuckDB's JSON profiling enabled, on a scratch copy of loan.db so that
+the UPDATE and CREATE TABLE questions can be run repeatedly. For each statement the run records its latency and the
+profiled operator tree: the time and cardinality of every operator, and the plan shape, i.e. the operators and the
+tables they scan, without the compression projections DuckDB adds depending on the data. The run is written to JSON and
+compared with a saved baseline, reporting questions that became slower than the threshold allows or whose plan changed.
+
+Example:
+    python query_profiler.py --update-baseline    # record the baseline
+    python query_profiler.py                      # compare with it, exits with 1 on a regression
+
+"""
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_profile_baseline.json')
+
+# Questions in the order they have to run, question 5 and 7 of Advanced_SQL read tables created by question 4 and 6
+QUESTIONS = [(f'SQL.{question.__name__}', question) for question in (
+    SQL.question_1, SQL.question_2, SQL.question_3, SQL.question_4, SQL.question_5)] + [
+    (f'Advanced_SQL.{question.__name__}', question) for question in (
+    Advanced_SQL.question_1, Advanced_SQL.question_2, Advanced_SQL.question_3, Advanced_SQL.question_4,
+    Advanced_SQL.question_5, Advanced_SQL.question_6, Advanced_SQL.question_7)]
+
+# Operators left out of the plan shape, DuckDB adds and removes them with the compression it picks for the data
+SHAPE_EXCLUDED = {'PROJECTION'}
+
+
+def flatten_profile(node, depth=0):
+    "function to list the operators of a JSON profile in pre-order, with their depth, time and cardinality"
+    operators = []
+    for child in node.get('children', []):
+        operators.append({'name': child['name'].strip(), 'depth': depth, 'seconds': child.get('timing', 0.0),
+                          'cardinality': child.get('cardinality', 0),
+                          'detail': child.get('extra_info', '').split('\n')[0].strip()})
+        operators.extend(flatten_profile(child, depth + 1))
+    return operators
+
+
+def plan_shape(node):
+    "function to describe the plan of a JSON profile as nested operator names, with the table of every scan"
+    children = [plan_shape(child) for child in node.get('children', [])]
+    name = node['name'].strip()
+    if name in SHAPE_EXCLUDED and len(children) == 1:
+        return children[0]
+    if name.endswith('SCAN'):
+        name += f"[{node.get('extra_info', '').split(chr(10))[0].strip()}]"
+    return f"{name}({', '.join(children)})" if children else name
+
+
+def profile_questions(database=None, questions=QUESTIONS, threads=None):
+    """
+        Run every question once on a scratch copy of the database with JSON profiling enabled.
+
+        Args:
+            database (str): Path of loan.db (default is 'database/loan.db')
+            questions (list): (name, question function) pairs, run in order
+            threads (int): Number of DuckDB threads (default is DuckDB's own setting)
+
+        Returns:
+            dict: Latency, plan shape and operators of every statement of every question, the shape is None and
+                  the operators are empty for statements DuckDB does not profile
+
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scratch_path = os.path.join(tmp_dir, 'loan.db')
+        profile_path = os.path.join(tmp_dir, 'profile.json')
+        shutil.copyfile(database or database_path, scratch_path)
+
+        cursor = duckdb.connect(scratch_path)
+        cursor.execute("SET enable_progress_bar = false")
+        if threads:
+            cursor.execute(f"SET threads = {int(threads)}")
+        cursor.execute("PRAGMA enable_profiling = 'json'")
+        cursor.execute(f"PRAGMA profiling_output = {sql_string(profile_path)}")
+
+        results = {}
+        for name, question in questions:
+            statements = []
+            for statement in split_statements(question()):
+                # Statements DuckDB does not profile, e.g. CREATE TABLE, write no file and must not get the last one
+                if os.path.exists(profile_path):
+                    os.remove(profile_path)
+                start = time.perf_counter()
+                cursor.execute(statement).fetchall()
+                seconds = time.perf_counter() - start
+
+                profile = {}
+                if os.path.exists(profile_path):
+                    with open(profile_path) as f:
+                        profile = json.load(f)
+                statements.append({'sql': statement, 'seconds': seconds, 'cardinality': profile.get('cardinality'),
+                                   'shape': plan_shape(profile) if profile else None,
+                                   'operators': flatten_profile(profile)})
+            results[name] = {'seconds': sum(statement['seconds'] for statement in statements),
+                             'statements': statements}
+        cursor.close()
+    return results
+
+
+def run_profiles(database=None, repeat=3, threads=None):
+    """
+        Profile the questions 'repeat' times, each on a fresh copy of the database, keeping the fastest run of each.
+
+        Args:
+            database (str): Path of loan.db (default is 'database/loan.db')
+            repeat (int): Number of runs of every question
+            threads (int): Number of DuckDB threads (default is DuckDB's own setting)
+
+        Returns:
+            dict: Run metadata and the profile of each question
+
+    """
+    runs = [profile_questions(database, threads=threads) for _ in range(repeat)]
+    queries = {name: min((run[name] for run in runs), key=lambda result: result['seconds']) for name, _ in QUESTIONS}
+    return {
+        'meta': {'duckdb': duckdb.__version__, 'python': platform.python_version(), 'machine': platform.machine(),
+                 'cpus': os.cpu_count(), 'threads': threads, 'repeat': repeat,
+                 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'queries': queries,
+    }
+
+
+def compare_to_baseline(results, baseline, threshold=0.25, min_seconds=0.002):
+    """
+        Find the questions that regressed against a baseline run.
+
+        Args:
+            results (dict): Output of 'run_profiles()'
+            baseline (dict): Output of an earlier 'run_profiles()'
+            threshold (float): Allowed relative increase in latency
+            min_seconds (float): Increases in latency smaller than this are ignored as noise
+
+        Returns:
+            list: One message per regressed question
+
+    """
+    regressions = []
+    for name, query in results['queries'].items():
+        base = baseline['queries'].get(name)
+        if base is None:
+            continue
+        if query['seconds'] > base['seconds'] * (1 + threshold) and query['seconds'] - base['seconds'] > min_seconds:
+            regressions.append(f"{name}: {query['seconds'] * 1000:.1f}ms vs baseline {base['seconds'] * 1000:.1f}ms")
+
+        shapes = [statement['shape'] for statement in query['statements']]
+        base_shapes = [statement['shape'] for statement in base['statements']]
+        for i, (shape, base_shape) in enumerate(zip(shapes, base_shapes)):
+            if shape != base_shape:
+                regressions.append(f"{name}: plan of statement {i + 1} changed\n"
+                                   f"    baseline: {base_shape}\n    now:      {shape}")
+        if len(shapes) != len(base_shapes):
+            regressions.append(f"{name}: {len(shapes)} statements vs baseline {len(base_shapes)}")
+    return regressions
+
+
+def format_results(results):
+    "function to format the latency and the slowest operator of every question as a table"
+    lines = [f"{'question':<26}{'ms':>9}  slowest operator"]
+    for name, query in results['queries'].items():
+        operators = [operator for statement in query['statements'] for operator in statement['operators']]
+        slowest = max(operators, key=lambda operator: operator['seconds'], default=None)
+        description = (f"{slowest['name']} {slowest['detail']} ({slowest['seconds'] * 1000:.2f}ms, "
+                       f"{slowest['cardinality']:,} rows)" if slowest else '')
+        lines.append(f"{name:<26}{query['seconds'] * 1000:>9.2f}  {description}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile the SQL question functions and compare with a baseline')
+    parser.add_argument('--database', default=database_path)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--output', help='write the profiles of this run to a JSON file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='JSON baseline to compare against')
+    parser.add_argument('--update-baseline', action='store_true', help='save this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative increase in latency')
+    args = parser.parse_args()
+
+    results = run_profiles(args.database, args.repeat, args.threads)
+    print(format_results(results))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.threshold)
+        for message in regressions:
+            print('REGRESSION', message)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import duckdb
+
+import Advanced_SQL
+import SQL
+from database.database_load import database_path
+from query_executor import split_statements
+
+"""
+Asyncio service serving the question functions of 'SQL.py' and 'Advanced_SQL.py' to many consumers at once.
+
+The service opens loan.db once, read only, and keeps a bounded pool of cursors on it. Every cursor is its own
+connection to the shared database instance, so concurrent reads do not contend for a lock and share the buffer cache,
+instead of every request opening a connection. Queries run on a thread pool of the same size as the cursor pool,
+DuckDB releases the GIL while executing, and waiting for a free cursor happens on the event loop, not in a thread.
+
+Results are returned as Arrow tables, or streamed as Arrow record batches so that large results are not held in
+memory at once. Questions that modify the database (e.g. 'SQL.question_5()') are rejected by DuckDB, being read only.
+
+Example:
+    async with QueryService() as service:
+        table = await service.run(SQL.question_2)
+        async for batch in service.stream(Advanced_SQL.question_1):
+            ...
+
+"""
+
+# Rows per record batch when streaming results
+DEFAULT_BATCH_SIZE = 100_000
+
+# The same questions are requested over and over, so their statements are only split once
+_split_statements = lru_cache(maxsize=256)(split_statements)
+
+
+class QueryService:
+    """
+        Serves queries concurrently from a bounded pool of read-only cursors.
+
+        Args:
+            database (str): Path of the DuckDB database (default is 'database/loan.db')
+            pool_size (int): Number of cursors, i.e. queries running at the same time (default is 8)
+            threads (int): Number of DuckDB threads shared by the queries (default is DuckDB's own setting)
+
+    """
+
+    def __init__(self, database=None, pool_size=8, threads=None):
+        self.database = database or database_path
+        self.pool_size = pool_size
+        config = {'threads': int(threads)} if threads else {}
+        self.connection = duckdb.connect(self.database, read_only=True, config=config)
+        self.connection.execute("SET enable_progress_bar = false")
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='query-service')
+        self._cursors = asyncio.Queue()
+        for _ in range(pool_size):
+            self._cursors.put_nowait(self.connection.cursor())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        "function to wait for the running queries to finish and close the cursors and the database"
+        cursors = [await self._cursors.get() for _ in range(self.pool_size)]
+        self._executor.shutdown(wait=True)
+        for cursor in cursors:
+            cursor.close()
+        self.connection.close()
+
+    def _release(self, cursor, future):
+        # Return the cursor to the pool once the thread using it is done, not as soon as the awaiting task is cancelled
+        if future is None or future.done():
+            self._cursors.put_nowait(cursor)
+        else:
+            loop = asyncio.get_running_loop()
+            future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._cursors.put_nowait, cursor))
+
+    @staticmethod
+    def _execute(cursor, qry):
+        # Run every statement of the question on the cursor, leaving the result of the last one pending
+        for statement in _split_statements(qry):
+            cursor.execute(statement)
+        return cursor
+
+    async def run(self, query):
+        """
+            Runs a query on a pooled cursor without blocking the event loop.
+
+            Args:
+                query (function or str): Question function returning a SQL string, or the SQL string itself
+
+            Returns:
+                pyarrow.Table: The result of the last statement
+        """
+        qry = query() if callable(query) else query
+        cursor = await self._cursors.get()
+        future = None
+        try:
+            future = self._executor.submit(lambda: self._execute(cursor, qry).arrow())
+            return await asyncio.wrap_future(future)
+        finally:
+            self._release(cursor, future)
+
+    async def stream(self, query, batch_size=DEFAULT_BATCH_SIZE):
+        """
+            Runs a query on a pooled cursor and yields its result as it is fetched.
+
+            Args:
+                query (function or str): Question function returning a SQL string, or the SQL string itself
+                batch_size (int): Rows per record batch (default is 100,000)
+
+            Yields:
+                pyarrow.RecordBatch: The next batch of rows of the result of the last statement
+        """
+        qry = query() if callable(query) else query
+        cursor = await self._cursors.get()
+        future = None
+        try:
+            future = self._executor.submit(lambda: self._execute(cursor, qry).fetch_record_batch(batch_size))
+            reader = await asyncio.wrap_future(future)
+            while True:
+                future = self._executor.submit(_next_batch, reader)
+                batch = await asyncio.wrap_future(future)
+                if batch is None:
+                    break
+                yield batch
+        finally:
+            self._release(cursor, future)
+
+
+def _next_batch(reader):
+    "function to read the next record batch, or None once the reader is exhausted"
+    try:
+        return reader.read_next_batch()
+    except StopIteration:
+        return None
+
+
+# Questions that only read from the tables created by 'database_load.py'
+READ_ONLY_QUESTIONS = (SQL.question_1, SQL.question_2, SQL.question_3, SQL.question_4, Advanced_SQL.question_1)
+
+
+async def benchmark_service(n_requests=1000, pool_size=8, threads=None, questions=READ_ONLY_QUESTIONS):
+    """
+        Sends many concurrent requests to a service and measures its throughput.
+
+        Args:
+            n_requests (int): Number of requests, all sent at once
+            pool_size (int): Number of cursors of the service
+            threads (int): Number of DuckDB threads (default is DuckDB's own setting)
+            questions (tuple): Question functions cycled through by the requests
+
+        Returns:
+            dict: Number of requests, elapsed seconds and requests per second
+    """
+    async with QueryService(pool_size=pool_size, threads=threads) as service:
+        start = time.perf_counter()
+        await asyncio.gather(*(service.run(questions[i % len(questions)]) for i in range(n_requests)))
+        seconds = time.perf_counter() - start
+    return {'requests': n_requests, 'seconds': seconds, 'requests_per_second': n_requests / seconds}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the throughput of the query service under concurrent load")
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+
+    result = asyncio.run(benchmark_service(args.requests, args.pool_size, args.threads))
+    print(f"{result['requests']} requests in {result['seconds']:.3f}s ({result['requests_per_second']:,.0f}/s)")
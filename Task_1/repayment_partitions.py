@@ -0,0 +1,131 @@
+import os
+import shutil
+import uuid
+
+import duckdb
+
+from database.database_load import TABLES, database_path, select_sql, sql_string
+
+"""
+Hive-partitioned Parquet storage of the 'repayments' table.
+
+The repayments are written to one folder per London year and month of the repayment,
+'RepaymentYear=2024/MonthID=3/...parquet', and 'use_partitioned_repayments()' exposes them to a connection as a
+temporary 'repayments' view, which takes precedence over the table of the same name in loan.db. The question
+functions then run unchanged, and filters on 'MonthID' or 'RepaymentYear' only open the files of the matching
+partitions, while date range filters skip files through the min/max statistics Parquet keeps per row group.
+
+New repayments are added by writing a new file to the partitions they fall into, the existing files are never
+rewritten.
+
+Example:
+    with duckdb.connect('database/loan.db') as cursor:
+        write_partitions(cursor)
+        use_partitioned_repayments(cursor)
+        cursor.execute(Advanced_SQL.question_4()).df()
+
+"""
+
+partitions_dir = os.path.join(os.path.dirname(__file__), 'database', 'partitions', 'repayments')
+
+# Columns encoded in the folder names
+PARTITION_COLUMNS = ('RepaymentYear', 'MonthID')
+
+# Repayments with their partition columns, the month is already stored in 'MonthID' by the loader
+PARTITIONED_QRY = "SELECT *, CAST(YEAR(RepaymentDateLondon) AS INTEGER) AS RepaymentYear FROM {source}"
+
+
+def partition_path(root, year, month):
+    "function to get the folder of one partition"
+    return os.path.join(root, f'RepaymentYear={year}', f'MonthID={month}')
+
+
+def write_partitions(cursor, root=None, source='main.repayments'):
+    """
+        Writes every repayment to the partitioned storage, replacing what was there.
+
+        Args:
+            cursor: DuckDB connection to loan.db
+            root (str): Folder of the partitioned storage (default is 'database/partitions/repayments')
+            source (str): Table or subquery with the columns of the 'repayments' table (default is 'main.repayments')
+
+        Returns:
+            int: Number of partitions written
+
+    """
+    root = root or partitions_dir
+
+    # Write to a temporary folder and swap it into place once complete
+    tmp_root = root.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_root, ignore_errors=True)
+    os.makedirs(os.path.dirname(tmp_root), exist_ok=True)
+    cursor.execute(f"""COPY ({PARTITIONED_QRY.format(source=source)} ORDER BY CustomerID, RepaymentDate)
+                       TO {sql_string(tmp_root)} (FORMAT PARQUET, PARTITION_BY ({', '.join(PARTITION_COLUMNS)}))""")
+    shutil.rmtree(root, ignore_errors=True)
+    os.replace(tmp_root, root)
+    return sum(len(os.listdir(os.path.join(root, year))) for year in os.listdir(root))
+
+
+def append_partitions(cursor, batch, root=None):
+    """
+        Adds new repayments to the partitioned storage, writing one new file to each partition they fall into.
+        A 'repayments' view created by 'use_partitioned_repayments()' on the connection is recreated over them.
+
+        Args:
+            cursor: DuckDB connection
+            batch (DataFrame or pyarrow.Table): New rows of 'Loan_Repayments.csv', the derived columns are added here
+            root (str): Folder of the partitioned storage (default is 'database/partitions/repayments')
+
+        Returns:
+            list: The (year, month) of every partition written to
+
+    """
+    root = root or partitions_dir
+    cursor.register('repayment_batch', batch)
+    try:
+        # Cast the new rows to the column types of the table, so that every file has the same schema, e.g. pandas
+        # int64 columns are written as INTEGER, then derive the London time columns as the loader does
+        casts = ', '.join(f"CAST({column} AS {dtype}) AS {column}" for column, dtype in TABLES['repayments'][1].items())
+        source = f"(SELECT {casts} FROM repayment_batch)"
+        cursor.execute(f"""CREATE OR REPLACE TEMP TABLE new_repayments AS
+                           {PARTITIONED_QRY.format(source=f'({select_sql("repayments", source)})')}""")
+
+        partitions = cursor.execute(f"""SELECT DISTINCT {', '.join(PARTITION_COLUMNS)} FROM new_repayments
+                                        ORDER BY ALL""").fetchall()
+        for year, month in partitions:
+            folder = partition_path(root, year, month)
+            os.makedirs(folder, exist_ok=True)
+            # Keep the partition columns in the file, as the COPY of 'write_partitions()' does
+            cursor.execute(f"""COPY (SELECT * FROM new_repayments
+                                     WHERE RepaymentYear = {int(year)} AND MonthID = {int(month)}
+                                     ORDER BY CustomerID, RepaymentDate)
+                               TO {sql_string(os.path.join(folder, f'part-{uuid.uuid4().hex}.parquet'))}
+                               (FORMAT PARQUET)""")
+        cursor.execute("DROP TABLE new_repayments")
+    finally:
+        cursor.unregister('repayment_batch')
+
+    # Rebind the 'repayments' view of this connection to the files now in the partitions
+    if cursor.execute("""SELECT COUNT(*) FROM duckdb_views()
+                         WHERE temporary AND view_name = 'repayments'""").fetchone()[0]:
+        use_partitioned_repayments(cursor, root)
+    return partitions
+
+
+def use_partitioned_repayments(cursor, root=None):
+    "function to make 'repayments' refer to the partitioned storage for the rest of the connection"
+    files = os.path.join(root or partitions_dir, '*', '*', '*.parquet')
+    casts = ', '.join(f"CAST({column} AS INTEGER) AS {column}" for column in PARTITION_COLUMNS)
+    cursor.execute(f"""CREATE OR REPLACE TEMP VIEW repayments AS
+                       SELECT * REPLACE ({casts})
+                       FROM read_parquet({sql_string(files)}, hive_partitioning = true)""")
+
+
+def use_table_repayments(cursor):
+    "function to make 'repayments' refer to the table in loan.db again"
+    cursor.execute("DROP VIEW IF EXISTS temp.repayments")
+
+
+if __name__ == '__main__':
+    with duckdb.connect(database_path) as cursor:
+        print(f"wrote {write_partitions(cursor)} partitions to {partitions_dir}")
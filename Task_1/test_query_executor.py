@@ -0,0 +1,58 @@
+import os
+
+import pyarrow.parquet as pq
+import pytest
+
+from query_executor import QueryExecutor
+
+"""
+Tests of the result cache of 'QueryExecutor' on a small scratch database.
+
+"""
+
+
+@pytest.fixture
+def executor(tmp_path):
+    with QueryExecutor(str(tmp_path / 'scratch.db')) as executor:
+        executor.run("""CREATE TABLE customers AS SELECT range AS CustomerID, range * 10 AS Income FROM range(5);
+                        CREATE TABLE credit AS SELECT range AS CustomerID, 'A' AS CustomerClass FROM range(5)""")
+        yield executor
+
+
+def test_repeated_read_is_cached(executor):
+    first = executor.run("SELECT SUM(Income) FROM customers")
+    assert executor.run("SELECT SUM(Income) FROM customers").equals(first)
+    assert executor.cache_info()['hits'] == 1
+
+
+def test_write_invalidates_read(executor):
+    assert executor.run("SELECT SUM(Income) FROM customers").to_pylist() == [{'sum(Income)': 100}]
+    executor.run("UPDATE customers SET Income = 0 WHERE CustomerID = 4")
+    assert executor.run("SELECT SUM(Income) FROM customers").to_pylist() == [{'sum(Income)': 60}]
+
+
+def test_join_using_runs_uncached(executor):
+    qry = "SELECT COUNT(*) AS n FROM customers JOIN credit USING (CustomerID)"
+    assert executor.run(qry).to_pylist() == [{'n': 5}]
+    executor.run("DELETE FROM credit WHERE CustomerID = 0")
+    assert executor.run(qry).to_pylist() == [{'n': 4}]
+
+
+def test_view_sees_writes_to_its_table(executor):
+    executor.run("CREATE VIEW class_a AS SELECT * FROM credit WHERE CustomerClass = 'A'")
+    assert executor.run("SELECT COUNT(*) AS n FROM class_a").to_pylist() == [{'n': 5}]
+    executor.run("UPDATE credit SET CustomerClass = 'B' WHERE CustomerID < 2")
+    assert executor.run("SELECT COUNT(*) AS n FROM class_a").to_pylist() == [{'n': 3}]
+
+
+def test_table_function_is_not_cached(executor, tmp_path):
+    path = str(tmp_path / 'rows.parquet')
+    qry = f"SELECT COUNT(*) AS n FROM read_parquet('{path}')"
+    executor.run(f"COPY (SELECT * FROM range(3)) TO '{path}' (FORMAT PARQUET)")
+    assert executor.run(qry).to_pylist() == [{'n': 3}]
+
+    # Rewritten outside of the executor
+    pq.write_table(executor.run("SELECT * FROM range(7)"), path)
+    assert os.path.exists(path)
+    assert executor.run(qry).to_pylist() == [{'n': 7}]
+    assert executor.cache_info()['entries'] == 0
@@ -0,0 +1,93 @@
+import os
+import shutil
+
+import duckdb
+import pandas as pd
+import pytest
+
+import timeline
+from database import database_load
+
+"""
+Tests of the incremental timeline against full rebuilds, on a scratch copy of loan.db and its csv files loaded with
+'database_load.load_database()'.
+
+"""
+
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    data_dir = tmp_path / 'data'
+    shutil.copytree(os.path.dirname(database_load.data_file_path('Months.csv')), data_dir)
+    shutil.copy2(database_load.database_path, tmp_path / 'loan.db')
+    monkeypatch.setattr(database_load, 'database_path', str(tmp_path / 'loan.db'))
+    monkeypatch.setattr(database_load, 'staging_dir', str(tmp_path / 'staging'))
+    monkeypatch.setattr(database_load, 'data_file_path', lambda filename: str(data_dir / filename))
+    return tmp_path
+
+
+def new_repayments(cursor, n=50, first_id=100_000):
+    "function to get repayments shaped like new rows of 'Loan_Repayments.csv', copied from existing ones"
+    return cursor.execute(f"""SELECT CAST(RepaymentID + {first_id} AS INTEGER) AS RepaymentID, RepaymentDate, Amount,
+                                     CustomerID, TimeZone
+                              FROM repayments ORDER BY RepaymentID LIMIT {n}""").df()
+
+
+def maintained_tables(cursor):
+    "function to get the incrementally maintained tables, in a stable order"
+    return (cursor.execute("SELECT * FROM timeline ORDER BY ALL").df(),
+            cursor.execute("SELECT * FROM timeline_pivot ORDER BY CustomerID").df())
+
+
+def assert_matches_rebuild(cursor):
+    "function to check the maintained tables against building them from scratch"
+    maintained = maintained_tables(cursor)
+    for statement in timeline.build_statements():
+        cursor.execute(statement)
+    for result, expected in zip(maintained, maintained_tables(cursor)):
+        pd.testing.assert_frame_equal(result, expected)
+
+
+def test_insert_repayments_matches_rebuild(scratch):
+    with duckdb.connect(database_load.database_path) as cursor:
+        timeline.build_timeline(cursor)
+        assert timeline.insert_repayments(cursor, new_repayments(cursor)) > 0
+        assert_matches_rebuild(cursor)
+
+
+def test_loader_keeps_and_refreshes_timeline(scratch):
+    with duckdb.connect(database_load.database_path) as cursor:
+        timeline.build_timeline(cursor)
+        batch = new_repayments(cursor)
+
+    actions = database_load.load_database()
+    assert actions['timeline']['action'] == 'unchanged'
+
+    # Rows appended to the csv file refresh the timeline in the same transaction as the append
+    with open(database_load.data_file_path('Loan_Repayments.csv'), 'a') as f:
+        batch.to_csv(f, header=False, index=False, date_format='%Y-%m-%dT%H:%M:%S.%f')
+    actions = database_load.load_database()
+    assert actions['repayments']['action'] == 'appended'
+    assert actions['timeline']['action'] == 'refreshed'
+    with duckdb.connect(database_load.database_path) as cursor:
+        assert cursor.execute("SELECT COUNT(*) FROM repayments WHERE RepaymentID >= 100000").fetchone()[0] == len(batch)
+        assert_matches_rebuild(cursor)
+
+
+def test_loader_rebuilds_timeline_with_its_sources(scratch):
+    with duckdb.connect(database_load.database_path) as cursor:
+        timeline.build_timeline(cursor)
+        timeline.insert_repayments(cursor, new_repayments(cursor))
+
+    # Rows inserted into loan.db only are replaced by the csv file, and the timeline is rebuilt to match
+    actions = database_load.load_database()
+    assert actions['repayments']['action'] == 'rebuilt'
+    assert actions['timeline']['action'] == 'rebuilt'
+    with duckdb.connect(database_load.database_path) as cursor:
+        assert cursor.execute("SELECT COUNT(*) FROM repayments WHERE RepaymentID >= 100000").fetchone()[0] == 0
+        assert_matches_rebuild(cursor)
+
+    actions = database_load.load_database(full=True)
+    assert actions['timeline']['action'] == 'rebuilt'
+    with duckdb.connect(database_load.database_path) as cursor:
+        assert_matches_rebuild(cursor)
@@ -0,0 +1,179 @@
+import re
+
+import Advanced_SQL
+from database.database_load import TABLES, register_maintained, select_sql
+from query_executor import split_statements
+
+"""
+Incremental maintenance of the 'timeline' table of 'Advanced_SQL.question_4()' and of its pivot from
+'Advanced_SQL.question_5()', materialized as the 'timeline_pivot' table.
+
+'build_timeline()' creates both tables from scratch. 'insert_repayments()' then adds a batch of repayments to the
+'repayments' table and recomputes only the (CustomerID, MonthName) cells of 'timeline' that the batch falls into, and
+only the 'timeline_pivot' rows of the customers involved, instead of cross-joining every customer with every month and
+re-pivoting the whole table. Both tables are built with the statements of questions 4 and 5 themselves, and the cells
+are refreshed with question 4's SELECT restricted to them, so both tables end up identical to rebuilding them.
+
+'build_timeline()' registers both tables with 'database_load.py', which keeps them from then on: rows appended to
+'Loan_Repayments.csv' refresh them in the same way as 'insert_repayments()', and they are rebuilt after 'customers',
+'months' or 'repayments' is rebuilt.
+
+Example:
+    cursor = duckdb.connect('database/loan.db')
+    build_timeline(cursor)
+    insert_repayments(cursor, df_new_repayments)
+
+"""
+
+# Tables maintained by this module and the loaded tables they are computed from
+TIMELINE_TABLES = ('timeline', 'timeline_pivot')
+TIMELINE_SOURCES = ('customers', 'months', 'repayments')
+
+# Restricts the timeline cells to the ones in the 'affected_cells' temporary table
+AFFECTED_CELLS_FILTER = """
+JOIN
+    affected_cells AS a
+        ON c.CustomerID = a.CustomerID
+        AND m.MonthID = a.MonthID
+"""
+
+# Repayments of the customers in the 'affected_cells' temporary table
+AFFECTED_REPAYMENTS = "(SELECT * FROM repayments WHERE CustomerID IN (SELECT CustomerID FROM affected_cells))"
+
+# Cells that the new repayments fall into, repayments outside of 6am to 6pm London time do not change the timeline
+AFFECTED_CELLS_QRY = """
+CREATE OR REPLACE TEMP TABLE affected_cells AS
+SELECT DISTINCT
+    CustomerID,
+    MonthID
+FROM
+    new_repayments
+WHERE
+    LondonHour BETWEEN 6 AND 18
+"""
+
+
+def timeline_statements():
+    "function to get the CREATE TABLE and INSERT statements of question 4"
+    create, insert = split_statements(Advanced_SQL.question_4())[:2]
+    return create, insert
+
+
+def _substitute(pattern, replacement, qry):
+    # Edit question 4's query in exactly one place, or fail rather than silently compute something else
+    qry, n = re.subn(pattern, replacement, qry)
+    if n != 1:
+        raise ValueError(f"Expected one match of {pattern!r} in 'Advanced_SQL.question_4()', found {n}")
+    return qry
+
+
+def timeline_cells_qry(cell_filter='', repayments='repayments'):
+    """
+        Derives the query of the timeline cells from the INSERT statement of question 4.
+
+        Args:
+            cell_filter (str): JOIN clause placed after the months, restricting the cells computed (default is all cells)
+            repayments (str): Table or subquery read in place of the 'repayments' table (default is 'repayments')
+
+        Returns:
+            str: The SELECT of question 4 with the filter and the repayments source applied
+    """
+    qry = _substitute(r'^INSERT INTO timeline\s*\([^)]*\)\s*', '', timeline_statements()[1])
+    qry = _substitute(r'\bmonths AS m\b', lambda match: f'{match.group(0)} {cell_filter.strip()}', qry)
+    return _substitute(r'\bJOIN repayments AS r\b', lambda match: f'JOIN {repayments} AS r', qry)
+
+
+def pivot_qry():
+    "function to get the pivot query of question 5 as a single statement"
+    return split_statements(Advanced_SQL.question_5())[0]
+
+
+def build_statements():
+    "function to get the statements that create (or recreate) the 'timeline' and 'timeline_pivot' tables"
+    create, insert = timeline_statements()
+    return [_substitute(r'^CREATE TABLE\b', 'CREATE OR REPLACE TABLE', create), insert,
+            f"CREATE OR REPLACE TABLE timeline_pivot AS {pivot_qry()} ORDER BY CustomerID"]
+
+
+def refresh_statements():
+    "function to get the statements that refresh the timeline cells and pivot rows of the rows in 'new_repayments'"
+    cells_qry = timeline_cells_qry(cell_filter=AFFECTED_CELLS_FILTER, repayments=AFFECTED_REPAYMENTS)
+    return [
+        AFFECTED_CELLS_QRY,
+
+        # Upsert the affected cells of the timeline
+        """DELETE FROM timeline AS t
+           USING affected_cells AS a, months AS m
+           WHERE t.CustomerID = a.CustomerID AND t.MonthName = m.MonthName AND m.MonthID = a.MonthID""",
+        f"INSERT INTO timeline {cells_qry}",
+
+        # Re-pivot the timeline rows of the affected customers only
+        "DELETE FROM timeline_pivot WHERE CustomerID IN (SELECT CustomerID FROM affected_cells)",
+        f"""INSERT INTO timeline_pivot
+            SELECT * FROM ({pivot_qry()})
+            WHERE CustomerID IN (SELECT CustomerID FROM affected_cells)
+            ORDER BY CustomerID""",
+        "DROP TABLE affected_cells",
+    ]
+
+
+def build_timeline(cursor):
+    """
+        Creates (or recreates) the 'timeline' table of question 4 and its pivot, the 'timeline_pivot' table, and
+        registers them with the loader, which then keeps them up to date when it loads loan.db.
+
+        Args:
+            cursor: DuckDB connection to loan.db
+
+    """
+    build = build_statements()
+    cursor.begin()
+    try:
+        for statement in build:
+            cursor.execute(statement)
+        register_maintained(cursor, 'timeline', TIMELINE_TABLES, TIMELINE_SOURCES, build, refresh_statements(),
+                            append_source='repayments')
+        cursor.commit()
+    except Exception:
+        cursor.rollback()
+        raise
+
+
+def insert_repayments(cursor, batch):
+    """
+        Inserts a batch of repayments and refreshes the timeline cells and pivot rows that it changes.
+
+        The rows are only added to loan.db: append them to 'Loan_Repayments.csv' as well, or the next run of
+        'database_load.py' finds 'repayments' changed, rebuilds it from the csv file without them and rebuilds the
+        timeline with it. Rows appended to the csv file alone are picked up by the loader, which refreshes the
+        timeline with the same statements as this function.
+
+        Args:
+            cursor: DuckDB connection to loan.db, on which 'build_timeline()' was run
+            batch (DataFrame or pyarrow.Table): New rows of 'Loan_Repayments.csv', the derived columns are added here
+
+        Returns:
+            int: The number of timeline cells refreshed
+
+    """
+    cursor.register('repayment_batch', batch)
+    cursor.begin()
+    try:
+        # Derive the London time columns of the new rows as the loader does
+        source = f"(SELECT {', '.join(TABLES['repayments'][1])} FROM repayment_batch)"
+        cursor.execute(f"CREATE OR REPLACE TEMP TABLE new_repayments AS {select_sql('repayments', source)}")
+        cursor.execute("INSERT INTO repayments BY NAME SELECT * FROM new_repayments")
+
+        affected_cells, *refresh = refresh_statements()
+        cursor.execute(affected_cells)
+        n_cells = cursor.execute("SELECT COUNT(*) FROM affected_cells").fetchone()[0]
+        for statement in refresh:
+            cursor.execute(statement)
+        cursor.execute("DROP TABLE new_repayments")
+        cursor.commit()
+    except Exception:
+        cursor.rollback()
+        raise
+    finally:
+        cursor.unregister('repayment_batch')
+    return n_cells
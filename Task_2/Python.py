@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 import os
+from contextlib import nullcontext
+from functools import cached_property, wraps
 
 """
 To answer the following questions, make use of datasets: 
@@ -15,7 +17,242 @@ A type 2 default will occur on a loan when more than 15% of the expected total p
 """
 
 
-def calculate_df_balances(df_scheduled,df_actual):
+# Names bound by 'from Python import *', the dataframes are resolved lazily by the module '__getattr__'
+__all__ = [
+    'df_scheduled', 'df_actual', 'df_balances', 'loader', 'LoanDataLoader', 'PortfolioMetrics',
+    'BALANCE_ENGINE_VERSION', 'SCHEDULED_DTYPES', 'ACTUAL_DTYPES', 'MONEY_COLUMNS', 'BALANCES_DTYPES',
+    'apply_schema', 'read_scheduled', 'read_actual', 'compact_df_balances', 'expand_df_balances', 'memory_report',
+    'roll_balances', 'calculate_balances_vectorized', 'calculate_df_balances', 'add_principal_columns',
+    'question_1', 'question_2', 'question_3', 'question_4', 'expected_loss_grid',
+]
+
+
+# Version of the balance calculation, bump whenever the output of 'calculate_df_balances()' changes
+BALANCE_ENGINE_VERSION = 1
+
+# Compact column types of the two datasets. Money is kept as float64 on read so that the balance engine sees 
+# exactly the values in the csv files. 'RepaymentID' stays float64 as the actual repayments contain a 
+# non-integer id (4614.49).
+SCHEDULED_DTYPES = {'LoanID': 'int32', 'LoanAmount': 'float64', 'ScheduledRepayment': 'float64'}
+ACTUAL_DTYPES = {'RepaymentID': 'float64', 'LoanID': 'int32', 'Month': 'int16', 'ActualRepayment': 'float64'}
+
+# Compact column types of 'df_balances', money columns fall back to float64 where float32 cannot hold them to the cent
+MONEY_COLUMNS = ['ActualRepayment', 'LoanAmount', 'ScheduledRepayment', 'LoanBalanceStart', 'LoanBalanceEnd', 
+                 'InterestPayment', 'ScheduledPrincipal', 'UnscheduledPrincipal']
+BALANCES_DTYPES = {'RepaymentID': 'float64', 'LoanID': 'int32', 'Month': 'int16', 
+                   **{column: 'float32' for column in MONEY_COLUMNS}}
+
+
+# Hook installed by 'profiling.StageProfiler' to record the stages of the pipeline, None when instrumentation is off
+_stage_hook = None
+_NO_STAGE = nullcontext()
+
+
+def _stage(name, rows=None):
+    "function to get the context manager that records a pipeline stage, a shared no-op yielding None when instrumentation is off"
+    if _stage_hook is None:
+        return _NO_STAGE
+    return _stage_hook(name, rows)
+
+
+def _instrumented(func):
+    "decorator to record a question function as a pipeline stage"
+    @wraps(func)
+    def wrapper(df_balances, *args, **kwargs):
+        if _stage_hook is None:
+            return func(df_balances, *args, **kwargs)
+        with _stage_hook(func.__name__, len(df_balances)):
+            return func(df_balances, *args, **kwargs)
+    return wrapper
+
+
+def apply_schema(df, schema):
+    """ 
+        Casts the columns of a Dataframe to a compact schema after checking that no information is lost.
+        Integer columns must hold whole numbers within the range of the target type, float32 columns are only 
+        used when every value still rounds to the same cent.
+
+        Args:
+            df (DataFrame): Dataframe to cast
+            schema (dict): Target dtype per column, columns missing from the Dataframe are ignored
+        
+        Returns:
+            DataFrame: The Dataframe with the compact dtypes
+
+    """
+
+    dtypes = {}
+    for column, dtype in schema.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        values = df[column].to_numpy()
+
+        if np.issubdtype(np.dtype(dtype), np.integer):
+            # Whole numbers that fit in the target integer type
+            limits = np.iinfo(dtype)
+            if not (np.all(np.mod(values, 1) == 0) and values.min(initial=0) >= limits.min and values.max(initial=0) <= limits.max):
+                raise ValueError(f"Column {column!r} cannot be stored as {dtype}")
+            dtypes[column] = dtype
+        else:
+            # Money that survives the round trip to the cent
+            narrowed = values.astype(dtype).astype('float64')
+            if np.array_equal(np.round(narrowed, 2), np.round(values, 2)):
+                dtypes[column] = dtype
+
+    return df.astype(dtypes)
+
+
+def read_scheduled(path):
+    "function to read the 'scheduled_loan_repayments.csv' dataset with the compact schema"
+    with _stage('read_scheduled') as stage:
+        df_scheduled = pd.read_csv(path, dtype=SCHEDULED_DTYPES)
+        if stage is not None:
+            stage['rows'] = len(df_scheduled)
+    return df_scheduled
+
+
+def read_actual(path, **kwargs):
+    "function to read the 'actual_loan_repayments.csv' dataset with the compact schema, 'chunksize' returns an iterator"
+    if 'chunksize' not in kwargs and 'iterator' not in kwargs:
+        with _stage('read_actual') as stage:
+            df_actual = apply_schema(pd.read_csv(path, dtype=ACTUAL_DTYPES, **kwargs), ACTUAL_DTYPES)
+            if stage is not None:
+                stage['rows'] = len(df_actual)
+        return df_actual
+    reader = pd.read_csv(path, dtype=ACTUAL_DTYPES, **kwargs)
+    return (apply_schema(chunk, ACTUAL_DTYPES) for chunk in reader)
+
+
+def compact_df_balances(df_balances):
+    "function to cast 'df_balances' to the compact 'BALANCES_DTYPES' schema"
+    return apply_schema(df_balances, BALANCES_DTYPES)
+
+
+def expand_df_balances(df_compact):
+    """ 
+        Restores a compact 'df_balances' to the float64 values produced by 'calculate_df_balances()'.
+
+        Args:
+            df_compact (DataFrame): Dataframe created from the 'compact_df_balances()' function
+        
+        Returns:
+            DataFrame: Dataframe with float64 money columns rounded back to the cent
+
+    """
+
+    df_balances = df_compact.copy()
+    for column in MONEY_COLUMNS:
+        if column in df_balances.columns:
+            df_balances[column] = df_balances[column].astype('float64').round(2)
+
+    # Scheduled principal is not rounded in 'calculate_df_balances()', so recalculate it from the rounded inputs
+    df_balances['ScheduledPrincipal'] = df_balances['ScheduledRepayment'] - df_balances['InterestPayment']
+    return df_balances
+
+
+def memory_report(df_before, df_after):
+    """ 
+        Compares the deep memory usage of two versions of a Dataframe column by column.
+
+        Args:
+            df_before (DataFrame): Dataframe before compaction
+            df_after (DataFrame): Dataframe after compaction
+        
+        Returns:
+            DataFrame: Bytes used before and after and the percentage saved per column, with a 'Total' row
+
+    """
+
+    report = pd.DataFrame({'Before': df_before.memory_usage(deep=True, index=False),
+                           'After': df_after.memory_usage(deep=True, index=False)})
+    report.loc['Total'] = report.sum()
+    report['SavedPercent'] = ((1 - report['After'] / report['Before']) * 100).round(1)
+    return report
+
+
+def roll_balances(opening_balance, actual_repayment, starts, annual_rate=0.1):
+    """ 
+        Rolls loans whose rows are stored contiguously and in month order forward one month at a time.
+        Every loan is stepped forward together with whole NumPy arrays on a loans x months grid.
+
+        Args:
+            opening_balance (ndarray): Balance each loan starts from, one value per loan
+            actual_repayment (ndarray): Actual repayment of every row, grouped by loan and sorted by month within each loan
+            starts (ndarray): Row offset of the first month of each loan
+            annual_rate (float): Annual interest rate of the loans (default is 10%)
+        
+        Returns:
+            tuple: Unrounded 'LoanBalanceStart', 'LoanBalanceEnd' and 'InterestPayment' arrays, one value per row
+
+    """
+
+    # Monthly interest rate calculated from the annual rate
+    r_monthly = annual_rate / 12
+
+    n_rows = len(actual_repayment)
+    counts = np.diff(np.r_[starts, n_rows])
+
+    # Map every row onto a (loan, month position) cell of a loans x months grid
+    rows = np.repeat(np.arange(len(starts)), counts)
+    cols = np.arange(n_rows) - np.repeat(starts, counts)
+    n_months = counts.max() if len(counts) else 0
+
+    repayments = np.zeros((len(starts), n_months))
+    repayments[rows, cols] = actual_repayment
+
+    # Initialize grids to store starting balances, interest payments and closing balances
+    balance_start = np.empty_like(repayments)
+    interest = np.empty_like(repayments)
+    balance_end = np.empty_like(repayments)
+
+    # Step all loans forward together from their opening balances
+    balance = np.asarray(opening_balance, dtype=float)
+    for month in range(n_months):
+        balance_start[:, month] = balance
+        interest[:, month] = balance * r_monthly
+        balance = np.maximum(0, balance + interest[:, month] - repayments[:, month])
+        balance_end[:, month] = balance
+
+    # Gather the grid cells back into row order
+    return balance_start[rows, cols], balance_end[rows, cols], interest[rows, cols]
+
+
+def calculate_balances_vectorized(df_merged, annual_rate=0.1, opening_balance=None):
+    """ 
+        Vectorized balance engine that rolls every loan forward one month at a time using whole NumPy arrays.
+        Produces the same 'LoanBalanceStart', 'LoanBalanceEnd' and 'InterestPayment' columns as the per-row loop
+        in 'calculate_df_balances()', without iterating over the rows of each loan in Python.
+
+        Args:
+            df_merged (DataFrame): Merged actual and scheduled repayments with columns 'LoanID', 'Month', 
+                                   'LoanAmount' and 'ActualRepayment'
+            annual_rate (float): Annual interest rate of the loans (default is 10%)
+            opening_balance (Series): Optional balance indexed by 'LoanID' to start each loan from instead of 'LoanAmount'
+        
+        Returns:
+            DataFrame: The merged Dataframe sorted by 'LoanID' and 'Month' with the unrounded balance columns added
+
+    """
+
+    # Sort by loan and month so that the months of each loan are contiguous
+    df = df_merged.sort_values(['LoanID', 'Month'], kind='stable').reset_index(drop=True)
+
+    # Locate the first row of each loan
+    loan_ids = df['LoanID'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, loan_ids[1:] != loan_ids[:-1]]) if len(df) else np.array([], dtype=int)
+
+    # Start from the loan amount in the first month, or from the carried balance when one is given
+    balance = df['LoanAmount'].to_numpy(dtype=float)[starts]
+    if opening_balance is not None:
+        carried = opening_balance.reindex(loan_ids[starts]).to_numpy(dtype=float)
+        balance = np.where(np.isnan(carried), balance, carried)
+
+    df['LoanBalanceStart'], df['LoanBalanceEnd'], df['InterestPayment'] = roll_balances(
+        balance, df['ActualRepayment'].to_numpy(dtype=float), starts, annual_rate)
+    return df
+
+
+def calculate_df_balances(df_scheduled,df_actual,engine='vectorized'):
     """ 
         This is a utility function that creates a merged dataframe that will be used in the following questions. 
         This function will not be graded directly.
@@ -23,6 +260,7 @@ def calculate_df_balances(df_scheduled,df_actual):
         Args:
             df_scheduled (DataFrame): Dataframe created from the 'scheduled_loan_repayments.csv' dataset
             df_actual (DataFrame): Dataframe created from the 'actual_loan_repayments.csv' dataset
+            engine (str): Balance engine to use, either 'vectorized' (default) or the reference 'iterrows' loop
         
         Returns:
             DataFrame: A merged Dataframe 
@@ -39,7 +277,8 @@ def calculate_df_balances(df_scheduled,df_actual):
 
     """
 
-    df_merged = pd.merge(df_actual, df_scheduled)
+    with _stage('merge', len(df_actual)):
+        df_merged = pd.merge(df_actual, df_scheduled)
 
     def calculate_balance(group):
         
@@ -79,8 +318,30 @@ def calculate_df_balances(df_scheduled,df_actual):
         group['InterestPayment'] = interest_payments
         return group
         
-    # Apply the calculate_balance function to each group of loans and reset index
-    df_balances = df_merged.groupby('LoanID').apply(calculate_balance).reset_index(drop=True)
+    with _stage(f'balance_{engine}', len(df_merged)):
+        if engine == 'vectorized':
+            df_balances = calculate_balances_vectorized(df_merged)
+        elif engine == 'iterrows':
+            # Apply the calculate_balance function to each group of loans and reset index
+            df_balances = df_merged.groupby('LoanID').apply(calculate_balance).reset_index(drop=True)
+        else:
+            raise ValueError(f"Unknown balance engine: {engine!r}")
+
+    with _stage('rounding', len(df_balances)):
+        return add_principal_columns(df_balances)
+
+
+def add_principal_columns(df_balances):
+    """ 
+        Rounds the balance columns and adds the scheduled and unscheduled principal columns.
+
+        Args:
+            df_balances (DataFrame): Dataframe with unrounded 'LoanBalanceStart', 'LoanBalanceEnd' and 'InterestPayment' columns
+        
+        Returns:
+            DataFrame: The same Dataframe with the rounded balances and the 'ScheduledPrincipal' and 'UnscheduledPrincipal' columns
+
+    """
 
     # Round the final balances and interest payments to two decimal places for clarity
     df_balances['LoanBalanceEnd'] = df_balances['LoanBalanceEnd'].round(2)
@@ -96,19 +357,55 @@ def calculate_df_balances(df_scheduled,df_actual):
     return df_balances
 
 
-#Do not edit these directories
-root = os.getcwd()
+class LoanDataLoader:
+    """ 
+        Loads the repayment datasets and the merged balances on first access and memoizes them.
+        Paths are resolved from the location of this module, so the result does not depend on the working directory.
+
+        Args:
+            data_dir (str): Folder containing the repayment csv files (default is the 'data' folder next to this file)
+            engine (str): Balance engine passed on to 'calculate_df_balances()'
+
+    """
+
+    def __init__(self, data_dir=None, engine='vectorized'):
+        self.data_dir = data_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+        self.engine = engine
+
+    def data_file_path(self, filename):
+        "function to get correct path to data files"
+        return os.path.join(self.data_dir, filename)
+
+    @cached_property
+    def df_scheduled(self):
+        return read_scheduled(self.data_file_path('scheduled_loan_repayments.csv'))
+
+    @cached_property
+    def df_actual(self):
+        return read_actual(self.data_file_path('actual_loan_repayments.csv'))
 
-if 'Task_2' in root:
-    df_scheduled = pd.read_csv('data/scheduled_loan_repayments.csv')
-    df_actual = pd.read_csv('data/actual_loan_repayments.csv')
-else:
-    df_scheduled = pd.read_csv('Task_2/data/scheduled_loan_repayments.csv')
-    df_actual = pd.read_csv('Task_2/data/actual_loan_repayments.csv')
+    @cached_property
+    def df_balances(self):
+        return calculate_df_balances(self.df_scheduled, self.df_actual, engine=self.engine)
 
-df_balances = calculate_df_balances(df_scheduled,df_actual)
+    def clear(self):
+        "function to drop the memoized frames so that the next access reloads them"
+        for name in ('df_scheduled', 'df_actual', 'df_balances'):
+            self.__dict__.pop(name, None)
 
 
+# Default loader behind the module level 'df_scheduled', 'df_actual' and 'df_balances' names
+loader = LoanDataLoader()
+
+
+def __getattr__(name):
+    # Resolve the dataframes lazily so that importing this module does not read the csv files
+    if name in ('df_scheduled', 'df_actual', 'df_balances'):
+        return getattr(loader, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@_instrumented
 def question_1(df_balances):
     """ 
         Calculate the percent of loans that defaulted as per the type 1 default definition 
@@ -136,6 +433,7 @@ def question_1(df_balances):
 
 
 
+@_instrumented
 def question_2(df_balances):
     """ 
         Calculate the percent of loans that defaulted as per the type 2 default definition 
@@ -171,6 +469,7 @@ def question_2(df_balances):
 
 
 
+@_instrumented
 def question_3(df_balances):
     """ 
         Calculate the anualized CPR (As a %) from the geometric mean SMM.
@@ -202,6 +501,7 @@ def question_3(df_balances):
     return cpr_percent
 
 
+@_instrumented
 def question_4(df_balances):
     """ 
         Calculate the predicted total loss for the second year in the loan term.
@@ -232,4 +532,124 @@ def question_4(df_balances):
     total_loss = round(prob_of_default * total_loan_balance * (1 - recovery_rate), 2)
     
 
-    return total_loss
\ No newline at end of file
+    return total_loss
+
+class PortfolioMetrics:
+    """ 
+        Computes the answers to questions 1 to 4 from aggregates that are built in one pass over 'df_balances' and cached.
+        The per-loan aggregates hold whether any repayment was missed and the scheduled and actual totals of each loan, 
+        the per-month aggregates hold the unscheduled principal and the starting and closing balances of each month.
+
+        Args:
+            df_balances (DataFrame): Dataframe created from the 'calculate_df_balances()' function
+
+    """
+
+    def __init__(self, df_balances):
+        self.df_balances = df_balances
+
+    @cached_property
+    def per_loan(self):
+        "Per-loan 'Missed' flag and 'ScheduledTotal' and 'ActualTotal' repayments"
+        df = pd.DataFrame({'LoanID': self.df_balances['LoanID'],
+                           'Missed': self.df_balances['ActualRepayment'] == 0,
+                           'ScheduledRepayment': self.df_balances['ScheduledRepayment'],
+                           'ActualRepayment': self.df_balances['ActualRepayment']})
+        return df.groupby('LoanID').agg(Missed=('Missed', 'any'),
+                                        ScheduledTotal=('ScheduledRepayment', 'sum'),
+                                        ActualTotal=('ActualRepayment', 'sum'))
+
+    @cached_property
+    def per_month(self):
+        "Per-month totals of 'UnscheduledPrincipal', 'LoanBalanceStart' and 'LoanBalanceEnd'"
+        return self.df_balances.groupby('Month')[['UnscheduledPrincipal', 'LoanBalanceStart', 'LoanBalanceEnd']].sum()
+
+    @property
+    def n_loans(self):
+        return len(self.per_loan)
+
+    def type_1_default_rate(self):
+        "Percent of loans with at least one missed repayment, as in 'question_1()'"
+        return round((self.per_loan['Missed'].sum() / self.n_loans) * 100, 2)
+
+    def type_2_default_rate(self):
+        "Percent of loans with more than 15% of the expected total payments unpaid, as in 'question_2()'"
+        repayment_diff_percent = (self.per_loan['ScheduledTotal'] - self.per_loan['ActualTotal']) / self.per_loan['ScheduledTotal']
+        return ((repayment_diff_percent > 0.15).sum() / self.n_loans) * 100
+
+    def cpr(self):
+        "Annualized CPR from the geometric mean SMM as a percent, as in 'question_3()'"
+        smm = (self.per_month['UnscheduledPrincipal'] / self.per_month['LoanBalanceStart']).to_numpy()
+        smm_mean = smm.prod()**(1.0/len(smm))
+        return round((1 - (1 - smm_mean)**12)*100, 2)
+
+    def default_probabilities(self):
+        "Probability of default per default definition, as a rate"
+        type_1 = ((self.per_loan['Missed'].sum() / self.n_loans) * 100)/100
+        return pd.Series({'type_1': type_1, 'type_2': self.type_2_default_rate()/100}, name='ProbabilityOfDefault')
+
+    def expected_loss_grid(self, recovery_rates=(0.80,), horizons=(12,), definitions=('type_1', 'type_2')):
+        """ 
+            Predicted loss for every combination of default definition, recovery rate and horizon month.
+            The probabilities of default and the horizon balances are calculated once and broadcast over the grid.
+
+            Args:
+                recovery_rates (array-like): Recovery rates to evaluate
+                horizons (array-like): Months whose total closing balance ('LoanBalanceEnd') is the exposure
+                definitions (tuple): Default definitions to use, 'type_1' and/or 'type_2'
+            
+            Returns:
+                DataFrame: One row per 'Definition', 'RecoveryRate' and 'HorizonMonth' with the 'ProbabilityOfDefault',
+                           'TotalLoanBalance' and 'ExpectedLoss'
+
+            Raises:
+                ValueError: When a horizon month has no balances in 'df_balances'
+
+        """
+
+        prob_of_default = self.default_probabilities()[list(definitions)].to_numpy()
+        recovery_rates = np.asarray(recovery_rates, dtype=float)
+        horizons = np.asarray(horizons)
+
+        # A horizon without balances would show up as a zero loss, which is indistinguishable from a real one
+        missing = [int(month) for month in horizons if month not in self.per_month.index]
+        if missing:
+            raise ValueError(f"No balances for horizon months {missing}, available months are "
+                             f"{self.per_month.index.min()} to {self.per_month.index.max()}")
+        total_loan_balance = self.per_month['LoanBalanceEnd'].reindex(horizons).to_numpy()
+
+        # Broadcast to a (definitions x recovery rates x horizons) grid in the same order of operations as 'question_4()'
+        loss = (prob_of_default[:, None, None] * total_loan_balance[None, None, :]) * (1 - recovery_rates)[None, :, None]
+
+        grid = pd.MultiIndex.from_product([list(definitions), recovery_rates, horizons], 
+                                          names=['Definition', 'RecoveryRate', 'HorizonMonth'])
+        shape = loss.shape
+        return pd.DataFrame({
+            'ProbabilityOfDefault': np.broadcast_to(prob_of_default[:, None, None], shape).ravel(),
+            'TotalLoanBalance': np.broadcast_to(total_loan_balance[None, None, :], shape).ravel(),
+            'ExpectedLoss': np.round(loss, 2).ravel(),
+        }, index=grid).reset_index()
+
+    def expected_loss(self, recovery_rate=0.80, month=12):
+        "Predicted loss from the type 2 probability of default and the closing balance of 'month', as in 'question_4()'"
+        prob_of_default = self.type_2_default_rate()/100
+        total_loan_balance = self.per_month['LoanBalanceEnd'].get(month, 0)
+        return round(prob_of_default * total_loan_balance * (1 - recovery_rate), 2)
+
+
+def expected_loss_grid(df_balances, recovery_rates=(0.80,), horizons=(12,), definitions=('type_1', 'type_2')):
+    """ 
+        Predicted loss over a grid of default definitions, recovery rates and horizon months.
+        See 'PortfolioMetrics.expected_loss_grid()'.
+
+        Args:
+            df_balances (DataFrame): Dataframe created from the 'calculate_df_balances()' function
+            recovery_rates (array-like): Recovery rates to evaluate
+            horizons (array-like): Months whose total closing balance is the exposure
+            definitions (tuple): Default definitions to use, 'type_1' and/or 'type_2'
+        
+        Returns:
+            DataFrame: Tidy loss grid with one row per combination
+
+    """
+    return PortfolioMetrics(df_balances).expected_loss_grid(recovery_rates, horizons, definitions)
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import Python
+
+"""
+Persistent on-disk cache for the 'df_balances' dataframe created by 'calculate_df_balances()'.
+
+The inputs are fingerprinted by size, modification time and a content hash. The computed dataframe is stored
+as an uncompressed Feather (Arrow IPC) file so that later runs can memory-map it instead of recomputing it.
+A cached file is only reused when the input fingerprints, the balance engine and its version all match.
+
+"""
+
+# Version of the cache layout, bump whenever the stored file format changes
+CACHE_FORMAT_VERSION = 2
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    "function to hash the contents of a file in fixed size chunks"
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BalanceCache:
+    """
+        Stores and retrieves 'df_balances' keyed by the fingerprints of the two repayment csv files.
+
+        Args:
+            cache_dir (str): Folder where the cached Feather files and fingerprint manifest are written
+            engine (str): Balance engine passed on to 'calculate_df_balances()' on a cache miss
+
+    """
+
+    def __init__(self, cache_dir=None, engine='vectorized'):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.engine = engine
+        self.manifest_path = os.path.join(self.cache_dir, 'fingerprints.json')
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def fingerprint(self, path):
+        """
+            Fingerprint a file by size, modification time and content hash.
+            The content hash is only recomputed when the size or modification time differ from the last recorded value.
+
+            Args:
+                path (str): Path of the file to fingerprint
+
+            Returns:
+                dict: The 'size', 'mtime_ns' and 'sha256' of the file
+
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        manifest = self._read_manifest()
+        recorded = manifest.get(path)
+
+        if recorded and recorded['size'] == stat.st_size and recorded['mtime_ns'] == stat.st_mtime_ns:
+            return recorded
+
+        fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+        manifest[path] = fingerprint
+        self._write_manifest(manifest)
+        return fingerprint
+
+    def key(self, scheduled_path, actual_path):
+        "function to build the cache key from the input content hashes and the engine version"
+        payload = {
+            'format': CACHE_FORMAT_VERSION,
+            'engine': self.engine,
+            'engine_version': Python.BALANCE_ENGINE_VERSION,
+            'scheduled': self.fingerprint(scheduled_path)['sha256'],
+            'actual': self.fingerprint(actual_path)['sha256'],
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:32]
+
+    def _prefix(self, scheduled_path, actual_path):
+        # Identify the pair of input files so that stale entries for the same inputs can be removed
+        paths = os.path.abspath(scheduled_path) + '|' + os.path.abspath(actual_path)
+        return 'df_balances-' + hashlib.sha256(paths.encode()).hexdigest()[:12]
+
+    def cache_path(self, scheduled_path, actual_path):
+        "function to get the path of the cached Feather file for the current inputs"
+        filename = f"{self._prefix(scheduled_path, actual_path)}-{self.key(scheduled_path, actual_path)}.feather"
+        return os.path.join(self.cache_dir, filename)
+
+    def load(self, scheduled_path, actual_path):
+        """
+            Memory-map the cached 'df_balances' for the given inputs.
+
+            Args:
+                scheduled_path (str): Path of the 'scheduled_loan_repayments.csv' dataset
+                actual_path (str): Path of the 'actual_loan_repayments.csv' dataset
+
+            Returns:
+                DataFrame: The cached dataframe, or None when there is no valid cache entry
+
+        """
+        path = self.cache_path(scheduled_path, actual_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            table = feather.read_table(path, memory_map=True)
+        except (OSError, pa.ArrowInvalid):
+            return None
+        return table.to_pandas(split_blocks=True)
+
+    def store(self, scheduled_path, actual_path, df_balances):
+        """
+            Write 'df_balances' to the cache and remove stale entries for the same inputs.
+
+            Args:
+                scheduled_path (str): Path of the 'scheduled_loan_repayments.csv' dataset
+                actual_path (str): Path of the 'actual_loan_repayments.csv' dataset
+                df_balances (DataFrame): Dataframe created from the 'calculate_df_balances()' function
+
+            Returns:
+                str: Path of the written Feather file
+
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.cache_path(scheduled_path, actual_path)
+
+        # Write uncompressed so that the file can be memory-mapped, then move it into place atomically
+        tmp_path = path + '.tmp'
+        table = pa.Table.from_pandas(df_balances, preserve_index=False)
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+
+        # Invalidate entries written for older versions of the same inputs or engine
+        prefix = self._prefix(scheduled_path, actual_path)
+        for filename in os.listdir(self.cache_dir):
+            stale_path = os.path.join(self.cache_dir, filename)
+            if filename.startswith(prefix) and filename.endswith('.feather') and stale_path != path:
+                os.remove(stale_path)
+        return path
+
+    def get_or_compute(self, scheduled_path, actual_path):
+        """
+            Return the cached 'df_balances' for the given inputs, computing and storing it on a cache miss.
+
+            Args:
+                scheduled_path (str): Path of the 'scheduled_loan_repayments.csv' dataset
+                actual_path (str): Path of the 'actual_loan_repayments.csv' dataset
+
+            Returns:
+                DataFrame: Dataframe equal to the output of the 'calculate_df_balances()' function
+
+        """
+        df_balances = self.load(scheduled_path, actual_path)
+        if df_balances is None:
+            df_scheduled = Python.read_scheduled(scheduled_path)
+            df_actual = Python.read_actual(actual_path)
+            df_balances = Python.calculate_df_balances(df_scheduled, df_actual, engine=self.engine)
+            self.store(scheduled_path, actual_path, df_balances)
+        return df_balances
+
+
+def cached_df_balances(loader=None, cache_dir=None):
+    """
+        Return 'df_balances' for the files of a 'LoanDataLoader', reusing the on-disk cache when the inputs are unchanged.
+
+        Args:
+            loader (LoanDataLoader): Loader whose data folder and engine are used (default is 'Python.loader')
+            cache_dir (str): Folder where the cache is kept
+
+        Returns:
+            DataFrame: Dataframe equal to the output of the 'calculate_df_balances()' function
+
+    """
+    loader = loader or Python.loader
+    cache = BalanceCache(cache_dir, engine=loader.engine)
+    return cache.get_or_compute(loader.data_file_path('scheduled_loan_repayments.csv'),
+                                loader.data_file_path('actual_loan_repayments.csv'))
@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import Python
+from synthetic import generate_loan_book
+
+"""
+Benchmark runner for the Task_2 pipeline.
+
+Generates a synthetic loan book, then times reading the csv files, 'calculate_df_balances()' and 'question_1()' to
+'question_4()'. Wall time, peak RSS and throughput of every stage are written to JSON and compared with a saved
+baseline, so that a stage that becomes slower or uses more memory than the baseline allows is reported.
+
+Example:
+    python benchmark.py --loans 100000 --months 24 --baseline benchmark_baseline.json
+
+"""
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+def _reset_peak_rss():
+    # Linux resets the peak resident set size (VmHWM) of the process when '5' is written to clear_refs
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_bytes():
+    "function to get the peak resident set size of the process since the last reset"
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # Fall back to the lifetime peak, reported in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_stage(name, func, rows, results):
+    "function to run one stage and record its wall time, peak RSS and throughput"
+    _reset_peak_rss()
+    start = time.perf_counter()
+    output = func()
+    seconds = time.perf_counter() - start
+    results[name] = {'seconds': seconds, 'peak_rss_bytes': _peak_rss_bytes(),
+                     'rows': rows, 'rows_per_second': rows / seconds if seconds else None}
+    return output
+
+
+def run_benchmark(n_loans=10_000, n_months=24, seed=0, data_dir=None):
+    """
+        Run every stage of the pipeline on a synthetic loan book.
+
+        Args:
+            n_loans (int): Number of loans in the synthetic book
+            n_months (int): Number of months of actual repayments per loan
+            seed (int): Seed of the synthetic data
+            data_dir (str): Folder for the synthetic csv files (default is a temporary folder)
+
+        Returns:
+            dict: Run metadata and the measurements of each stage
+
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scheduled_path, actual_path = generate_loan_book(data_dir or tmp_dir, n_loans, n_months, seed=seed)
+        n_rows = n_loans * n_months
+        stages = {}
+
+        df_scheduled = run_stage('read_scheduled', lambda: Python.read_scheduled(scheduled_path), n_loans, stages)
+        df_actual = run_stage('read_actual', lambda: Python.read_actual(actual_path), n_rows, stages)
+
+    df_balances = run_stage('calculate_df_balances', lambda: Python.calculate_df_balances(df_scheduled, df_actual),
+                            n_rows, stages)
+    for question in (Python.question_1, Python.question_2, Python.question_3, Python.question_4):
+        run_stage(question.__name__, lambda: question(df_balances), n_rows, stages)
+
+    return {
+        'meta': {'loans': n_loans, 'months': n_months, 'rows': n_rows, 'seed': seed,
+                 'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                 'machine': platform.machine(), 'cpus': os.cpu_count(),
+                 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'stages': stages,
+    }
+
+
+def compare_to_baseline(results, baseline, time_threshold=0.25, memory_threshold=0.25):
+    """
+        Find the stages that regressed against a baseline run of the same size.
+
+        Args:
+            results (dict): Output of 'run_benchmark()'
+            baseline (dict): Output of an earlier 'run_benchmark()'
+            time_threshold (float): Allowed relative increase in wall time
+            memory_threshold (float): Allowed relative increase in peak RSS
+
+        Returns:
+            list: One message per regressed stage
+
+    """
+    if (results['meta']['loans'], results['meta']['months']) != (baseline['meta']['loans'], baseline['meta']['months']):
+        raise ValueError("The baseline was recorded for a different loan book size")
+
+    regressions = []
+    for name, stage in results['stages'].items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            continue
+        if stage['seconds'] > base['seconds'] * (1 + time_threshold):
+            regressions.append(f"{name}: {stage['seconds']:.3f}s vs baseline {base['seconds']:.3f}s")
+        if stage['peak_rss_bytes'] > base['peak_rss_bytes'] * (1 + memory_threshold):
+            regressions.append(f"{name}: peak RSS {stage['peak_rss_bytes'] / 2**20:.0f} MiB "
+                               f"vs baseline {base['peak_rss_bytes'] / 2**20:.0f} MiB")
+    return regressions
+
+
+def format_results(results):
+    "function to format the stage measurements as a table"
+    df = pd.DataFrame(results['stages']).T
+    df['peak_rss_mib'] = df['peak_rss_bytes'] / 2**20
+    return df[['seconds', 'peak_rss_mib', 'rows_per_second']].to_string(float_format=lambda x: f"{x:,.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Task_2 pipeline on a synthetic loan book')
+    parser.add_argument('--loans', type=int, default=10_000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results of this run to a JSON file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='JSON baseline to compare against')
+    parser.add_argument('--update-baseline', action='store_true', help='save this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative regression')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.loans, args.months, args.seed)
+    print(format_results(results))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.threshold, args.threshold)
+        for message in regressions:
+            print('REGRESSION', message)
+        sys.exit(1 if regressions else 0)
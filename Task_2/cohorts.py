@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+"""
+Prepayment (SMM and CPR) curves for many cohorts at once.
+
+'question_3()' computes a single portfolio-wide CPR. The functions below group 'df_balances' by a cohort key and
+'Month' in one pass and derive the curves of every cohort with grouped, vectorized operations. Geometric means are
+taken in log space, so that they do not underflow to zero over many months or small SMMs the way a product does.
+
+"""
+
+
+def origination_cohort(df_balances):
+    "function to get the first recorded month of each row's loan, for use as a cohort key"
+    return df_balances.groupby('LoanID')['Month'].transform('min').rename('OriginationMonth')
+
+
+def loan_size_cohort(df_balances, bins=(0, 25_000, 50_000, 75_000, 100_000, np.inf)):
+    "function to get the loan amount bucket of each row, for use as a cohort key"
+    return pd.cut(df_balances['LoanAmount'], bins=list(bins), right=False).rename('LoanSizeBucket')
+
+
+def _cohort_keys(df_balances, cohort):
+    # Accept a column name, a list of column names, an aligned Series or None for the whole portfolio
+    if cohort is None:
+        return [pd.Series('Portfolio', index=df_balances.index, name='Cohort')]
+    if isinstance(cohort, str):
+        return [df_balances[cohort]]
+    if isinstance(cohort, pd.Series):
+        return [cohort]
+    return [df_balances[key] if isinstance(key, str) else key for key in cohort]
+
+
+def _annualize(smm):
+    "function to convert a monthly SMM into an annual CPR as a percent"
+    return (1 - (1 - smm)**12) * 100
+
+
+def prepayment_curves(df_balances, cohort=None, window=3):
+    """
+        Calculate the monthly SMM and the rolling and to-date CPR of every cohort in one grouped pass.
+        SMM is calculated as: (Unscheduled Principal)/(Start of Month Loan Balance)
+        CPR is calculated as: 1 - (1 - SMM_mean)^12, with SMM_mean the geometric mean SMM
+
+        Args:
+            df_balances (DataFrame): Dataframe created from the 'calculate_df_balances()' function
+            cohort (str, list or Series): Column name(s) or Series aligned with 'df_balances' that define the cohorts,
+                                          e.g. 'origination_cohort()' or 'loan_size_cohort()' (default is the whole portfolio)
+            window (int): Number of months in the rolling geometric mean
+
+        Returns:
+            DataFrame: One row per cohort and month with columns 'UnscheduledPrincipal', 'LoanBalanceStart', 'SMM',
+                       'RollingSMM', 'RollingCPR', 'GeoMeanSMM' and 'CPR' (CPR columns as a percent)
+
+    """
+    keys = _cohort_keys(df_balances, cohort)
+    cohort_levels = list(range(len(keys)))
+
+    # Total Unscheduled Principal and Starting Loan Balance per cohort and month, in a single groupby
+    curves = df_balances.groupby(keys + [df_balances['Month']], observed=True)[
+        ['UnscheduledPrincipal', 'LoanBalanceStart']].sum()
+    curves['SMM'] = curves['UnscheduledPrincipal'] / curves['LoanBalanceStart']
+
+    # Work in log space, counting zero SMMs separately as they force the geometric mean to zero
+    smm = curves['SMM'].to_numpy()
+    is_zero = smm <= 0
+    log_smm = pd.Series(np.log(np.where(is_zero, 1.0, smm)), index=curves.index)
+    zeros = pd.Series(is_zero.astype(np.int64), index=curves.index)
+
+    by_cohort = log_smm.groupby(level=cohort_levels, observed=True)
+    months_to_date = by_cohort.cumcount().to_numpy() + 1
+    log_to_date = by_cohort.cumsum()
+    zeros_to_date = zeros.groupby(level=cohort_levels, observed=True).cumsum()
+
+    # Rolling sums as the difference between the running sum and the running sum 'window' months earlier
+    log_rolling = log_to_date - log_to_date.groupby(level=cohort_levels, observed=True).shift(window, fill_value=0.0)
+    zeros_rolling = zeros_to_date - zeros_to_date.groupby(level=cohort_levels, observed=True).shift(window, fill_value=0)
+    months_rolling = np.minimum(months_to_date, window)
+
+    curves['RollingSMM'] = np.where(zeros_rolling > 0, 0.0, np.exp(log_rolling / months_rolling))
+    curves['RollingCPR'] = _annualize(curves['RollingSMM'])
+    curves['GeoMeanSMM'] = np.where(zeros_to_date > 0, 0.0, np.exp(log_to_date / months_to_date))
+    curves['CPR'] = _annualize(curves['GeoMeanSMM'])
+    return curves
+
+
+def cohort_cpr(df_balances, cohort=None):
+    """
+        Calculate the annualized CPR (As a %) of every cohort over all of its months, as 'question_3()' does for the portfolio.
+
+        Args:
+            df_balances (DataFrame): Dataframe created from the 'calculate_df_balances()' function
+            cohort (str, list or Series): Cohort definition as in 'prepayment_curves()'
+
+        Returns:
+            Series: The CPR of each cohort as a percent rounded to two decimals
+
+    """
+    curves = prepayment_curves(df_balances, cohort, window=1)
+    n_levels = curves.index.nlevels - 1
+    return curves['CPR'].groupby(level=list(range(n_levels)), observed=True).last().round(2)
@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import Python
+
+"""
+Memory-mapped, loan-major columnar store for the repayment history.
+
+Every column of 'df_balances' is written to its own .npy file with all the months of a loan stored next to each other
+in month order, and 'offsets.npy' holds the row where each loan starts. Opening the store memory-maps the files, so
+later runs skip csv parsing, merging, sorting and regrouping: a loan's history is a zero-copy slice of every column and
+the balance engine runs straight on the mapped arrays.
+
+"""
+
+# Version of the store layout, bump whenever the files written by 'LoanColumnStore.build()' change
+STORE_FORMAT_VERSION = 1
+
+INPUT_COLUMNS = ['RepaymentID', 'LoanID', 'Month', 'ActualRepayment', 'LoanAmount', 'ScheduledRepayment']
+
+
+def _source_fingerprint(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class LoanColumnStore:
+    """
+        Read-only view of a store written by 'LoanColumnStore.build()'.
+
+        Args:
+            store_dir (str): Folder of the store
+
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+        # Memory-map every column, nothing is read from disk until it is used
+        self.columns = {name: np.load(os.path.join(store_dir, f'{name}.npy'), mmap_mode='r')
+                        for name in self.meta['columns']}
+        self.offsets = np.load(os.path.join(store_dir, 'offsets.npy'), mmap_mode='r')
+        self.loan_ids = np.load(os.path.join(store_dir, 'loan_ids.npy'), mmap_mode='r')
+        self._loan_index = pd.Index(self.loan_ids)
+
+    @classmethod
+    def build(cls, store_dir, scheduled_path, actual_path):
+        """
+            Parse, merge and sort the datasets once and write them to a loan-major store together with their balances.
+
+            Args:
+                store_dir (str): Folder to write the store to, replaced if it exists
+                scheduled_path (str): Path of the 'scheduled_loan_repayments.csv' dataset
+                actual_path (str): Path of the 'actual_loan_repayments.csv' dataset
+
+            Returns:
+                LoanColumnStore: The opened store
+
+        """
+        df_balances = Python.calculate_df_balances(Python.read_scheduled(scheduled_path), Python.read_actual(actual_path))
+
+        # Write to a temporary folder and swap it into place once complete
+        tmp_dir = store_dir.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        # 'calculate_df_balances()' returns the rows sorted by LoanID and Month, i.e. already loan-major
+        for name in df_balances.columns:
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), df_balances[name].to_numpy())
+
+        loan_ids = df_balances['LoanID'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, loan_ids[1:] != loan_ids[:-1]]) if len(loan_ids) else np.array([], dtype=int)
+        np.save(os.path.join(tmp_dir, 'offsets.npy'), np.r_[starts, len(loan_ids)].astype(np.int64))
+        np.save(os.path.join(tmp_dir, 'loan_ids.npy'), loan_ids[starts])
+
+        meta = {
+            'format': STORE_FORMAT_VERSION,
+            'engine_version': Python.BALANCE_ENGINE_VERSION,
+            'columns': list(df_balances.columns),
+            'rows': len(df_balances),
+            'sources': {'scheduled': _source_fingerprint(scheduled_path), 'actual': _source_fingerprint(actual_path)},
+        }
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        shutil.rmtree(store_dir, ignore_errors=True)
+        os.replace(tmp_dir, store_dir)
+        return cls(store_dir)
+
+    @classmethod
+    def open_or_build(cls, store_dir, scheduled_path, actual_path):
+        "function to open the store, rebuilding it when the source files or the engine version changed"
+        try:
+            store = cls(store_dir)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls.build(store_dir, scheduled_path, actual_path)
+
+        sources = {'scheduled': _source_fingerprint(scheduled_path), 'actual': _source_fingerprint(actual_path)}
+        if (store.meta['format'], store.meta['engine_version'], store.meta['sources']) != (
+                STORE_FORMAT_VERSION, Python.BALANCE_ENGINE_VERSION, sources):
+            return cls.build(store_dir, scheduled_path, actual_path)
+        return store
+
+    @property
+    def n_loans(self):
+        return len(self.loan_ids)
+
+    def loan(self, loan_id):
+        "function to get the history of one loan as zero-copy slices of every column"
+        position = self._loan_index.get_loc(loan_id)
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return {name: column[start:end] for name, column in self.columns.items()}
+
+    def df_balances(self, columns=None):
+        "Dataframe over the mapped columns without copying them, in the layout of 'calculate_df_balances()'"
+        columns = columns or self.meta['columns']
+        return pd.DataFrame({name: np.asarray(self.columns[name]) for name in columns}, copy=False)
+
+    def recompute_balances(self, annual_rate=0.1):
+        """
+            Rerun the balance engine on the mapped inputs, without sorting or regrouping them.
+
+            Args:
+                annual_rate (float): Annual interest rate of the loans (default is 10%)
+
+            Returns:
+                DataFrame: Dataframe equal to the output of the 'calculate_df_balances()' function
+
+        """
+        starts = np.asarray(self.offsets[:-1])
+        df = self.df_balances(INPUT_COLUMNS).copy()
+        opening_balance = self.columns['LoanAmount'][starts]
+        df['LoanBalanceStart'], df['LoanBalanceEnd'], df['InterestPayment'] = Python.roll_balances(
+            opening_balance, self.columns['ActualRepayment'], starts, annual_rate)
+        return Python.add_principal_columns(df)
@@ -0,0 +1,240 @@
+import os
+
+import duckdb
+
+import Python
+
+"""
+DuckDB execution path for the Task_2 balance and metric pipeline.
+
+DuckDB reads the repayment csv or Parquet files directly, merges them, rolls every loan forward with a recursive CTE
+(one iteration per month, all loans at once) and computes the aggregates behind 'question_1()' to 'question_4()'.
+Work is multi-threaded and can spill to disk, and results are returned as Arrow tables.
+
+The SQL repeats the floating point operations of 'calculate_df_balances()' in the same order and rounds half to even
+like pandas, so both engines give identical results. Only the final scalar formula of each question is applied in
+Python, on the handful of aggregates that DuckDB returns.
+
+"""
+
+# Round half to even to the cent, matching pandas' Series.round(2)
+ROUND_CENTS_MACRO = """
+CREATE OR REPLACE TEMP MACRO round_cents(x) AS (
+    CASE
+        WHEN x * 100 - floor(x * 100) = 0.5 THEN (floor(x * 100) + floor(x * 100) % 2) / 100
+        ELSE round(x * 100) / 100
+    END
+)"""
+
+MERGED_QRY = """
+CREATE OR REPLACE TEMP TABLE merged AS
+SELECT
+    a.RepaymentID, a.LoanID, a.Month, a.ActualRepayment, s.LoanAmount, s.ScheduledRepayment,
+    -- Position of the month within each loan, used to step the recursive roll-forward
+    ROW_NUMBER() OVER (PARTITION BY a.LoanID ORDER BY a.Month) AS Step
+FROM
+    actual AS a
+JOIN
+    scheduled AS s
+        ON a.LoanID = s.LoanID
+"""
+
+BALANCES_QRY = """
+CREATE OR REPLACE TEMP TABLE balances AS
+WITH RECURSIVE loans AS (
+    -- One row per loan holding its repayments in month order, so that the recursion never joins the full history
+    SELECT
+        LoanID,
+        FIRST(LoanAmount) AS LoanAmount,
+        LIST(ActualRepayment ORDER BY Step) AS Repayments,
+        COUNT(*) AS NumberOfMonths
+    FROM
+        merged
+    GROUP BY
+        LoanID
+),
+roll AS (
+    -- The first month of each loan starts from the loan amount
+    SELECT
+        LoanID, 1 AS Step, Repayments, NumberOfMonths,
+        LoanAmount AS LoanBalanceStart,
+        LoanAmount * $r_monthly AS InterestPayment,
+        GREATEST(0.0, (LoanAmount + LoanAmount * $r_monthly) - Repayments[1]) AS LoanBalanceEnd
+    FROM
+        loans
+
+    UNION ALL
+
+    -- Every following month starts from the closing balance of the month before
+    SELECT
+        LoanID, Step + 1, Repayments, NumberOfMonths,
+        LoanBalanceEnd,
+        LoanBalanceEnd * $r_monthly,
+        GREATEST(0.0, (LoanBalanceEnd + LoanBalanceEnd * $r_monthly) - Repayments[Step + 1])
+    FROM
+        roll
+    WHERE
+        Step < NumberOfMonths
+)
+SELECT
+    m.RepaymentID, m.LoanID, m.Month, m.ActualRepayment, m.LoanAmount, m.ScheduledRepayment,
+    round_cents(r.LoanBalanceStart) AS LoanBalanceStart,
+    round_cents(r.LoanBalanceEnd) AS LoanBalanceEnd,
+    round_cents(r.InterestPayment) AS InterestPayment,
+    m.ScheduledRepayment - round_cents(r.InterestPayment) AS ScheduledPrincipal,
+    CASE
+        WHEN m.ActualRepayment > m.ScheduledRepayment THEN m.ActualRepayment - m.ScheduledRepayment
+        ELSE 0.0
+    END AS UnscheduledPrincipal
+FROM
+    merged AS m
+JOIN
+    roll AS r
+        ON m.LoanID = r.LoanID
+        AND m.Step = r.Step
+ORDER BY
+    m.LoanID, m.Month
+"""
+
+
+PER_LOAN_QRY = """
+SELECT
+    COUNT(*) AS n_loans,
+    COUNT(*) FILTER (WHERE Missed) AS n_missed,
+    COUNT(*) FILTER (WHERE (ScheduledTotal - ActualTotal) / ScheduledTotal > 0.15) AS n_type_2
+FROM (
+    SELECT
+        LoanID,
+        BOOL_OR(ActualRepayment = 0) AS Missed,
+        KAHAN_SUM(ScheduledRepayment) AS ScheduledTotal,
+        KAHAN_SUM(ActualRepayment) AS ActualTotal
+    FROM
+        balances
+    GROUP BY
+        LoanID
+)
+"""
+
+PER_MONTH_QRY = """
+SELECT
+    Month,
+    KAHAN_SUM(UnscheduledPrincipal) AS UnscheduledPrincipal,
+    KAHAN_SUM(LoanBalanceStart) AS LoanBalanceStart,
+    KAHAN_SUM(LoanBalanceEnd) AS LoanBalanceEnd
+FROM
+    balances
+GROUP BY
+    Month
+ORDER BY
+    Month
+"""
+
+
+def sql_string(value):
+    "function to quote a file path as a SQL string literal, as 'database_load.sql_string()' does in Task_1"
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _relation_sql(path, columns):
+    "function to get a relation that reads a csv file, a Parquet file or a folder of Parquet files with the given column types"
+    if path.endswith('.parquet') or os.path.isdir(path):
+        # A folder is read with all the Parquet files below it, e.g. a Hive partitioned dataset
+        if os.path.isdir(path):
+            path = os.path.join(path, '**', '*.parquet')
+            files = f"read_parquet({sql_string(path)}, hive_partitioning = true)"
+        else:
+            files = f"read_parquet({sql_string(path)})"
+        casts = ', '.join(f"CAST({name} AS {dtype}) AS {name}" for name, dtype in columns.items())
+        return f"(SELECT {casts} FROM {files})"
+    column_types = ', '.join(f"{sql_string(name)}: {sql_string(dtype)}" for name, dtype in columns.items())
+    return f"read_csv({sql_string(path)}, header=True, columns={{{column_types}}})"
+
+
+class DuckDBEngine:
+    """
+        Runs the balance calculation and the question aggregates inside DuckDB.
+
+        Args:
+            scheduled_path (str): Path of the scheduled repayments csv or Parquet file, or a folder of Parquet files
+                                  (default is the bundled dataset)
+            actual_path (str): Path of the actual repayments csv or Parquet file, or a folder of Parquet files
+                               (default is the bundled dataset)
+            database (str): DuckDB database to work in (default is in memory)
+            threads (int): Number of DuckDB threads (default is DuckDB's own setting)
+            annual_rate (float): Annual interest rate of the loans (default is 10%)
+
+    """
+
+    def __init__(self, scheduled_path=None, actual_path=None, database=':memory:', threads=None, annual_rate=0.1):
+        self.scheduled_path = scheduled_path or Python.loader.data_file_path('scheduled_loan_repayments.csv')
+        self.actual_path = actual_path or Python.loader.data_file_path('actual_loan_repayments.csv')
+        self.annual_rate = annual_rate
+        self.cursor = duckdb.connect(database)
+        self.cursor.execute("SET enable_progress_bar = false")
+        if threads:
+            self.cursor.execute(f"SET threads = {int(threads)}")
+
+        self.cursor.execute(ROUND_CENTS_MACRO)
+        self.cursor.execute(f"""CREATE OR REPLACE TEMP VIEW scheduled AS SELECT * FROM {_relation_sql(self.scheduled_path, {
+            'LoanID': 'INTEGER', 'LoanAmount': 'DOUBLE', 'ScheduledRepayment': 'DOUBLE'})}""")
+        self.cursor.execute(f"""CREATE OR REPLACE TEMP VIEW actual AS SELECT * FROM {_relation_sql(self.actual_path, {
+            'RepaymentID': 'DOUBLE', 'LoanID': 'INTEGER', 'Month': 'SMALLINT', 'ActualRepayment': 'DOUBLE'})}""")
+        self._computed = False
+
+    def close(self):
+        self.cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _compute(self):
+        # Materialize the merged repayments and the balances once, the questions all read from them
+        if not self._computed:
+            self.cursor.execute(MERGED_QRY)
+            self.cursor.execute(BALANCES_QRY, {'r_monthly': self.annual_rate / 12})
+            self._computed = True
+
+    def balances(self):
+        "Arrow table with the same rows and columns as the output of 'calculate_df_balances()'"
+        self._compute()
+        # The table was written in LoanID and Month order and DuckDB preserves insertion order when scanning it
+        return self.cursor.execute("SELECT * FROM balances").arrow()
+
+    def df_balances(self):
+        "DataFrame with the same rows and columns as the output of 'calculate_df_balances()'"
+        return self.balances().to_pandas()
+
+    def _per_loan(self):
+        self._compute()
+        return self.cursor.execute(PER_LOAN_QRY).fetchone()
+
+    def _per_month(self):
+        self._compute()
+        return self.cursor.execute(PER_MONTH_QRY).arrow()
+
+    def question_1(self):
+        "Percent of loans that defaulted as per the type 1 default definition, as in 'Python.question_1()'"
+        n_loans, n_missed, _ = self._per_loan()
+        return round((n_missed / n_loans) * 100, 2)
+
+    def question_2(self):
+        "Percent of loans that defaulted as per the type 2 default definition, as in 'Python.question_2()'"
+        n_loans, _, n_type_2 = self._per_loan()
+        return (n_type_2 / n_loans) * 100
+
+    def question_3(self):
+        "Annualized CPR from the geometric mean SMM as a percent, as in 'Python.question_3()'"
+        per_month = self._per_month()
+        smm = (per_month['UnscheduledPrincipal'].to_numpy() / per_month['LoanBalanceStart'].to_numpy())
+        smm_mean = smm.prod()**(1.0/len(smm))
+        return round((1 - (1 - smm_mean)**12)*100, 2)
+
+    def question_4(self, recovery_rate=0.80, month=12):
+        "Predicted total loss for the second year in the loan term, as in 'Python.question_4()'"
+        prob_of_default = self.question_2()/100
+        total_loan_balance = self.cursor.execute(
+            "SELECT COALESCE(KAHAN_SUM(LoanBalanceEnd), 0) FROM balances WHERE Month = ?", [month]).fetchone()[0]
+        return round(prob_of_default * total_loan_balance * (1 - recovery_rate), 2)
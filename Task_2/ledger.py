@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+import Python
+
+"""
+Stateful loan ledger that keeps the closing balance and last month of every loan.
+
+New months of actual repayments are appended as they arrive. Only the new rows are rolled forward, starting
+from the carried balances, so the cost of an update grows with the size of the batch rather than the history.
+
+"""
+
+
+class LoanLedger:
+    """
+        Incrementally maintained 'df_balances'.
+
+        Args:
+            df_scheduled (DataFrame): Dataframe created from the 'scheduled_loan_repayments.csv' dataset
+            annual_rate (float): Annual interest rate of the loans (default is 10%)
+            keep_history (bool): Keep the computed rows so that 'df_balances' can be returned (default is True)
+
+    """
+
+    def __init__(self, df_scheduled, annual_rate=0.1, keep_history=True):
+        self.df_scheduled = df_scheduled.reset_index(drop=True)
+        self.annual_rate = annual_rate
+        self.keep_history = keep_history
+
+        # Position of each loan in the per-loan state arrays
+        self._loan_index = pd.Index(self.df_scheduled['LoanID'])
+
+        # Unrounded closing balance and last month per loan (NaN / 0 until the loan's first repayment arrives)
+        self._balance = np.full(len(self._loan_index), np.nan)
+        self._last_month = np.zeros(len(self._loan_index), dtype=np.int64)
+
+        self._batches = []
+        self._df_balances = None
+
+    @classmethod
+    def from_history(cls, df_scheduled, df_actual, annual_rate=0.1):
+        "function to create a ledger and load the full repayment history into it"
+        ledger = cls(df_scheduled, annual_rate=annual_rate)
+        ledger.append(df_actual)
+        return ledger
+
+    @property
+    def state(self):
+        "Per-loan 'LoanBalanceEnd' and 'Month' of the last recorded repayment"
+        started = self._last_month > 0
+        return pd.DataFrame({'LoanBalanceEnd': self._balance[started].round(2),
+                             'Month': self._last_month[started]},
+                            index=self._loan_index[started])
+
+    def append(self, df_new_actual):
+        """
+            Roll the loans forward over a new batch of actual repayments.
+
+            Args:
+                df_new_actual (DataFrame): New rows shaped like the 'actual_loan_repayments.csv' dataset
+
+            Returns:
+                DataFrame: The 'df_balances' rows computed for the new batch
+
+        """
+        if df_new_actual.empty:
+            return df_new_actual.copy()
+
+        # Look up the scheduled data of each new row by position instead of merging against the full table
+        positions = self._loan_index.get_indexer(df_new_actual['LoanID'])
+        if (positions < 0).any():
+            unknown = df_new_actual['LoanID'][positions < 0].unique()
+            raise ValueError(f"Repayments for loans missing from the schedule: {unknown[:10].tolist()}")
+
+        # Months must continue after the last month already recorded for each loan
+        if (df_new_actual['Month'].to_numpy() <= self._last_month[positions]).any():
+            raise ValueError("New repayments must be for months after the last recorded month of each loan")
+
+        df_merged = df_new_actual.reset_index(drop=True)
+        df_merged['LoanAmount'] = self.df_scheduled['LoanAmount'].to_numpy()[positions]
+        df_merged['ScheduledRepayment'] = self.df_scheduled['ScheduledRepayment'].to_numpy()[positions]
+
+        # Start every loan in the batch from its carried balance, or from 'LoanAmount' for new loans
+        batch_positions = np.unique(positions)
+        opening_balance = pd.Series(self._balance[batch_positions], index=self._loan_index[batch_positions])
+        df_batch = Python.calculate_balances_vectorized(df_merged, self.annual_rate, opening_balance)
+
+        # Carry the unrounded closing balance and month of each loan's last row into the state
+        last_rows = np.r_[df_batch['LoanID'].to_numpy()[1:] != df_batch['LoanID'].to_numpy()[:-1], True]
+        last_positions = self._loan_index.get_indexer(df_batch['LoanID'][last_rows])
+        self._balance[last_positions] = df_batch['LoanBalanceEnd'].to_numpy()[last_rows]
+        self._last_month[last_positions] = df_batch['Month'].to_numpy()[last_rows]
+
+        df_batch = Python.add_principal_columns(df_batch)
+        if self.keep_history:
+            self._batches.append(df_batch)
+            self._df_balances = None
+        return df_batch
+
+    @property
+    def df_balances(self):
+        "Full history in the same layout as the output of 'calculate_df_balances()'"
+        if not self.keep_history:
+            raise ValueError("The ledger was created with keep_history=False")
+        if self._df_balances is None:
+            if not self._batches:
+                return pd.DataFrame()
+            df = pd.concat(self._batches, ignore_index=True)
+            self._df_balances = df.sort_values(['LoanID', 'Month'], kind='stable').reset_index(drop=True)
+            self._batches = [self._df_balances]
+        return self._df_balances
@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import pandas as pd
+import pyarrow as pa
+
+import Python
+
+"""
+Multi-core sharded execution of the balance calculation.
+
+Loans are independent, so the merged repayments are hash-partitioned by 'LoanID' and each shard is rolled forward
+by a separate process. Shards are handed to the workers as Arrow IPC streams in shared memory and the results come
+back as Arrow IPC buffers, so no DataFrame is pickled. The shards are concatenated and sorted by 'LoanID' and
+'Month', which gives the same row order as 'calculate_df_balances()' regardless of the number of workers.
+
+"""
+
+
+def _table_to_buffer(table):
+    "function to serialize an Arrow table to an IPC stream buffer"
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _buffer_to_frame(buffer):
+    "function to read an IPC stream buffer back into a DataFrame"
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+
+def _balance_shard(shm_name, size, annual_rate):
+    # Attach to the shard written by the parent, copy it out and release the shared memory view
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        df_shard = _buffer_to_frame(pa.py_buffer(shm.buf[:size]))
+    finally:
+        shm.close()
+
+    df_shard = Python.calculate_balances_vectorized(df_shard, annual_rate)
+    df_shard = Python.add_principal_columns(df_shard)
+    return _table_to_buffer(pa.Table.from_pandas(df_shard, preserve_index=False)).to_pybytes()
+
+
+def calculate_df_balances_parallel(df_scheduled, df_actual, workers=None, n_shards=None, annual_rate=0.1):
+    """
+        Parallel version of 'calculate_df_balances()' that shards the loans across a process pool.
+
+        Args:
+            df_scheduled (DataFrame): Dataframe created from the 'scheduled_loan_repayments.csv' dataset
+            df_actual (DataFrame): Dataframe created from the 'actual_loan_repayments.csv' dataset
+            workers (int): Number of worker processes (default is the number of CPUs)
+            n_shards (int): Number of LoanID hash partitions (default is the number of workers)
+            annual_rate (float): Annual interest rate of the loans (default is 10%)
+
+        Returns:
+            DataFrame: Dataframe equal to the output of the 'calculate_df_balances()' function
+
+    """
+    workers = workers or os.cpu_count() or 1
+    n_shards = n_shards or workers
+
+    df_merged = pd.merge(df_actual, df_scheduled)
+
+    # Run in process when there is nothing to parallelize
+    if workers == 1 and n_shards == 1:
+        df_balances = Python.calculate_balances_vectorized(df_merged, annual_rate)
+        return Python.add_principal_columns(df_balances)
+
+    # Hash-partition the rows by LoanID so that every loan lands in exactly one shard
+    shard_ids = pd.util.hash_array(df_merged['LoanID'].to_numpy()) % n_shards
+
+    segments = []
+    try:
+        # Write every shard to its own shared memory block as an Arrow IPC stream
+        for shard in range(n_shards):
+            df_shard = df_merged[shard_ids == shard]
+            if df_shard.empty:
+                continue
+            buffer = _table_to_buffer(pa.Table.from_pandas(df_shard, preserve_index=False))
+            shm = shared_memory.SharedMemory(create=True, size=buffer.size)
+            shm.buf[:buffer.size] = memoryview(buffer).cast('B')
+            segments.append((shm, buffer.size))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_balance_shard, shm.name, size, annual_rate) for shm, size in segments]
+            results = [_buffer_to_frame(pa.py_buffer(future.result())) for future in futures]
+    finally:
+        for shm, _ in segments:
+            shm.close()
+            shm.unlink()
+
+    # Concatenate the shards in a deterministic LoanID and Month order
+    df_balances = pd.concat(results, ignore_index=True)
+    return df_balances.sort_values(['LoanID', 'Month'], kind='stable').reset_index(drop=True)
+
+
+def tile_loan_book(df_scheduled, df_actual, factor):
+    "function to enlarge the loan book by repeating every loan 'factor' times under new LoanIDs"
+    offset = int(df_scheduled['LoanID'].max()) + 1
+    df_scheduled = pd.concat([df_scheduled.assign(LoanID=df_scheduled['LoanID'] + i * offset) for i in range(factor)],
+                             ignore_index=True)
+    df_actual = pd.concat([df_actual.assign(LoanID=df_actual['LoanID'] + i * offset) for i in range(factor)],
+                          ignore_index=True)
+    return df_scheduled, df_actual
+
+
+def benchmark_parallel(df_scheduled, df_actual, worker_counts=(1, 2, 4, 8), repeat=3):
+    """
+        Time 'calculate_df_balances_parallel()' for different numbers of workers.
+
+        Args:
+            df_scheduled (DataFrame): Dataframe created from the 'scheduled_loan_repayments.csv' dataset
+            df_actual (DataFrame): Dataframe created from the 'actual_loan_repayments.csv' dataset
+            worker_counts (tuple): Numbers of workers to time
+            repeat (int): Number of runs per worker count, the fastest run is reported
+
+        Returns:
+            DataFrame: Best wall time in seconds and speedup over the first worker count, per number of workers
+
+    """
+    timings = []
+    for workers in worker_counts:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            calculate_df_balances_parallel(df_scheduled, df_actual, workers=workers)
+            best = min(best, time.perf_counter() - start)
+        timings.append({'Workers': workers, 'Seconds': best})
+
+    df_timings = pd.DataFrame(timings)
+    df_timings['Speedup'] = df_timings['Seconds'].iloc[0] / df_timings['Seconds']
+    df_timings['RowsPerSecond'] = len(df_actual) / df_timings['Seconds']
+    return df_timings
+
+
+if __name__ == '__main__':
+    # Scaling benchmark on the bundled loan book repeated 'factor' times, e.g. `python parallel.py 500`
+    factor = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    df_scheduled, df_actual = tile_loan_book(Python.df_scheduled, Python.df_actual, factor)
+    print(f"{len(df_scheduled):,} loans, {len(df_actual):,} loan-months, {os.cpu_count()} CPUs")
+    print(benchmark_parallel(df_scheduled, df_actual).to_string(index=False))
@@ -0,0 +1,112 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+import Python
+
+"""
+Stage-level instrumentation for the Task_2 pipeline.
+
+'Python.py' marks its stages (reading the csv files, the merge, the balance engine, the rounding pass and the
+question functions) with a hook that does nothing unless a 'StageProfiler' is active. While one is active every stage
+records its wall time, CPU time, rows processed and peak traced memory, and the run can be reported as JSON or as a
+table. Nested stages, such as 'question_2()' inside 'question_4()', are recorded with their depth.
+
+Example:
+    with StageProfiler() as profiler:
+        df_balances = Python.calculate_df_balances(df_scheduled, df_actual)
+        Python.question_4(df_balances)
+    print(profiler.to_table())
+
+"""
+
+
+class StageProfiler:
+    """
+        Records the stages of the pipeline run while the profiler is active.
+
+        Args:
+            trace_memory (bool): Record the peak memory of each stage with tracemalloc (default is True)
+
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.records = []
+        self._stack = []
+        self._started_tracing = False
+        self._previous_hook = None
+
+    def __enter__(self):
+        self.started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._previous_hook = Python._stage_hook
+        Python._stage_hook = self.stage
+        return self
+
+    def __exit__(self, *exc_info):
+        Python._stage_hook = self._previous_hook
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        "context manager that records one stage, yielding its record so that 'rows' can be filled in afterwards"
+        record = {'stage': name, 'depth': len(self._stack), 'rows': rows}
+        self.records.append(record)
+
+        if self.trace_memory:
+            # Hand the peak so far to the enclosing stage before resetting it for this one
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+            tracemalloc.reset_peak()
+            record['_start'], record['_peak'] = current, current
+
+        self._stack.append(record)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - wall_start
+            record['cpu_seconds'] = time.process_time() - cpu_start
+            self._stack.pop()
+
+            if self.trace_memory:
+                peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+                record['peak_memory_bytes'] = peak - record.pop('_start')
+                if self._stack:
+                    self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+
+    def report(self):
+        "Structured report of the run"
+        return {'started_at': self.started_at, 'trace_memory': self.trace_memory, 'stages': self.records}
+
+    def to_json(self, path=None):
+        "function to get the report as JSON, also written to 'path' when given"
+        report = json.dumps(self.report(), indent=2)
+        if path:
+            with open(path, 'w') as f:
+                f.write(report)
+        return report
+
+    def to_frame(self):
+        "function to get the stages as a DataFrame, nested stages indented under their parent"
+        df = pd.DataFrame(self.records)
+        if df.empty:
+            return df
+        df['stage'] = ['  ' * depth + name for depth, name in zip(df['depth'], df['stage'])]
+        return df.drop(columns='depth').set_index('stage')
+
+    def to_table(self):
+        "function to get the stages as a human-readable table"
+        df = self.to_frame()
+        if 'peak_memory_bytes' in df.columns:
+            df['peak_memory_mib'] = df.pop('peak_memory_bytes') / 2**20
+        return df.to_string(float_format=lambda x: f"{x:,.4f}")
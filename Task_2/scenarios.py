@@ -0,0 +1,162 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import Python
+
+"""
+Monte Carlo scenario engine for default and prepayment losses over the second year of the loan term.
+
+Every loan starts the horizon at its month 12 closing balance and amortizes with its scheduled repayment. In each
+month a loan either defaults (losing its outstanding balance times one minus the recovery rate), prepays in full
+or carries on, and both events end the loan. A default is checked before a prepayment in the same month.
+
+Rather than drawing a Bernoulli event for every scenario x loan x month cell, the month of the first default and
+of the first prepayment of each scenario x loan pair are drawn directly from their geometric distributions. This
+has the same distribution as the monthly draws, but only needs two random numbers per loan per scenario. Scenarios
+are processed in batches of (scenarios x loans) arrays, optionally spread over a process pool.
+
+"""
+
+# Shared inputs of the worker processes, set once per worker by '_init_worker()'
+_WORKER_INPUTS = {}
+
+
+def _init_worker(exposure, monthly_pd, monthly_smm, loss_given_default):
+    _WORKER_INPUTS.update(exposure=exposure, monthly_pd=monthly_pd, monthly_smm=monthly_smm,
+                          loss_given_default=loss_given_default)
+
+
+def _first_event_month(uniform, monthly_rate):
+    "function to turn uniform draws into the month (1, 2, ...) of the first event of a geometric distribution"
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_survival = np.log1p(-monthly_rate)
+        # A certain event (rate 1) has an infinite log survival and a ratio of 0, it happens in the first month
+        return np.maximum(1, np.ceil(np.log(uniform) / log_survival))
+
+
+def simulate_batch(exposure, monthly_pd, monthly_smm, loss_given_default, n_scenarios, seed):
+    """
+        Simulate the total loss of a batch of scenarios.
+
+        Args:
+            exposure (ndarray): Outstanding balance per loan at the start of each horizon month, shaped (loans x months)
+            monthly_pd (ndarray): Monthly probability of default per loan
+            monthly_smm (ndarray): Monthly probability of prepayment (SMM) per loan
+            loss_given_default (float): Share of the outstanding balance lost on default
+            n_scenarios (int): Number of scenarios in the batch
+            seed (SeedSequence): Seed of the batch
+
+        Returns:
+            ndarray: Total loss per scenario
+
+    """
+    rng = np.random.default_rng(seed)
+    n_loans, horizon = exposure.shape
+
+    # Draw the month of the first default and first prepayment of every scenario x loan pair
+    # (1 - U) keeps the draws in (0, 1] so that the logarithm stays finite
+    default_month = _first_event_month(1 - rng.random((n_scenarios, n_loans)), monthly_pd)
+    prepay_month = _first_event_month(1 - rng.random((n_scenarios, n_loans)), monthly_smm)
+
+    # A loan defaults when the default falls inside the horizon and is not preceded by a prepayment
+    defaulted = (default_month <= horizon) & (default_month <= prepay_month)
+    month_index = np.where(defaulted, default_month - 1, 0).astype(np.intp)
+
+    # Look up the outstanding balance in the month of default for every scenario x loan pair
+    balance_at_default = exposure[np.arange(n_loans), month_index]
+    return np.where(defaulted, balance_at_default, 0).sum(axis=1) * loss_given_default
+
+
+def _simulate_worker_batch(n_scenarios, seed):
+    return simulate_batch(n_scenarios=n_scenarios, seed=seed, **_WORKER_INPUTS)
+
+
+class ScenarioEngine:
+    """
+        Simulates loss distributions for the loans in 'df_balances'.
+
+        Args:
+            df_balances (DataFrame): Dataframe created from the 'calculate_df_balances()' function
+            prob_of_default (float or ndarray): Annual probability of default, per loan or for all loans
+                                               (default is the type 2 default rate of 'df_balances')
+            cpr (float or ndarray): Annual prepayment rate, per loan or for all loans (default is the CPR of 'df_balances')
+            recovery_rate (float): Share of the outstanding balance recovered on default (default is 80%)
+            horizon (int): Number of months to simulate after the last month in 'df_balances' (default is 12)
+            annual_rate (float): Annual interest rate of the loans (default is 10%)
+
+    """
+
+    def __init__(self, df_balances, prob_of_default=None, cpr=None, recovery_rate=0.80, horizon=12, annual_rate=0.1):
+        metrics = Python.PortfolioMetrics(df_balances)
+        if prob_of_default is None:
+            prob_of_default = metrics.type_2_default_rate() / 100
+        if cpr is None:
+            cpr = metrics.cpr() / 100
+
+        # Starting balance and scheduled repayment of each loan at the end of its last recorded month
+        df_last = df_balances.sort_values(['LoanID', 'Month'], kind='stable').groupby('LoanID').tail(1)
+        self.loan_ids = df_last['LoanID'].to_numpy()
+        balance = df_last['LoanBalanceEnd'].to_numpy(dtype=float)
+        scheduled = df_last['ScheduledRepayment'].to_numpy(dtype=float)
+
+        # Outstanding balance at the start of every horizon month when the loan keeps to its schedule
+        self.exposure = np.empty((len(balance), horizon))
+        for month in range(horizon):
+            self.exposure[:, month] = balance
+            balance = np.maximum(0, balance * (1 + annual_rate / 12) - scheduled)
+
+        # Convert the annual rates into monthly event probabilities
+        n_loans = len(self.loan_ids)
+        self.monthly_pd = np.broadcast_to(1 - (1 - np.asarray(prob_of_default, dtype=float))**(1 / 12), n_loans)
+        self.monthly_smm = np.broadcast_to(1 - (1 - np.asarray(cpr, dtype=float))**(1 / 12), n_loans)
+        self.loss_given_default = 1 - recovery_rate
+
+    def simulate(self, n_scenarios=10_000, seed=None, batch_size=None, workers=1):
+        """
+            Simulate the total loss of every scenario.
+
+            Args:
+                n_scenarios (int): Number of scenarios
+                seed (int): Seed of the random number generator, the same seed gives the same losses for any number of workers
+                batch_size (int): Scenarios per batch (default keeps each batch array at about 4 million cells)
+                workers (int): Number of worker processes the batches are spread over (default is 1)
+
+            Returns:
+                ndarray: Total loss per scenario
+
+        """
+        n_loans = len(self.loan_ids)
+        batch_size = batch_size or max(1, 4_000_000 // max(n_loans, 1))
+        batch_sizes = [min(batch_size, n_scenarios - start) for start in range(0, n_scenarios, batch_size)]
+
+        # One child seed per batch so that the results do not depend on how the batches are distributed
+        seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+        inputs = (self.exposure, self.monthly_pd, self.monthly_smm, self.loss_given_default)
+
+        if workers == 1:
+            losses = [simulate_batch(*inputs, size, batch_seed) for size, batch_seed in zip(batch_sizes, seeds)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=inputs) as executor:
+                losses = list(executor.map(_simulate_worker_batch, batch_sizes, seeds))
+
+        return np.concatenate(losses) if losses else np.empty(0)
+
+    def loss_quantiles(self, n_scenarios=10_000, quantiles=(0.5, 0.9, 0.95, 0.99, 0.999), seed=None, **kwargs):
+        """
+            Simulate the scenarios and summarize the loss distribution.
+
+            Args:
+                n_scenarios (int): Number of scenarios
+                quantiles (tuple): Quantiles of the total loss to return
+                seed (int): Seed of the random number generator
+                **kwargs: 'batch_size' and 'workers' passed on to 'simulate()'
+
+            Returns:
+                Series: The mean total loss and the requested quantiles
+
+        """
+        losses = self.simulate(n_scenarios, seed=seed, **kwargs)
+        summary = pd.Series(np.quantile(losses, quantiles), index=[f"q{q:g}" for q in quantiles])
+        return pd.concat([pd.Series({'mean': losses.mean()}), summary])
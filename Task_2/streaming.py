@@ -0,0 +1,68 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import Python
+from ledger import LoanLedger
+
+"""
+Out-of-core streaming mode for 'calculate_df_balances()'.
+
+The actual repayments are read in chunks and joined against the (small) scheduled table one chunk at a time.
+Per-loan balance state is carried across chunk boundaries by a 'LoanLedger' that does not keep the history, and
+each chunk of results is written straight to Parquet. Peak memory is bounded by the chunk size plus one balance
+per loan, no matter how large the repayment file is.
+
+The file must list the months of each loan in increasing order, e.g. sorted by 'LoanID' and 'Month' or in
+chronological order. Rows are written in the order they are read, one row group per chunk.
+
+"""
+
+
+def stream_df_balances(scheduled_path, actual_path, output_path, chunksize=1_000_000, annual_rate=0.1):
+    """
+        Compute 'df_balances' chunk by chunk and write it to a Parquet file.
+
+        Args:
+            scheduled_path (str): Path of the 'scheduled_loan_repayments.csv' dataset
+            actual_path (str): Path of the 'actual_loan_repayments.csv' dataset
+            output_path (str): Path of the Parquet file to write
+            chunksize (int): Number of actual repayment rows to read per chunk
+            annual_rate (float): Annual interest rate of the loans (default is 10%)
+
+        Returns:
+            int: Number of rows written
+
+    """
+    df_scheduled = Python.read_scheduled(scheduled_path)
+    ledger = LoanLedger(df_scheduled, annual_rate=annual_rate, keep_history=False)
+
+    # Write to a temporary file and move it into place once complete so that readers never see a partial file
+    tmp_path = output_path + '.tmp'
+    writer = None
+    n_rows = 0
+    try:
+        for df_chunk in Python.read_actual(actual_path, chunksize=chunksize):
+            df_batch = ledger.append(df_chunk)
+            table = pa.Table.from_pandas(df_batch, preserve_index=False)
+
+            # Fix the schema on the first chunk and cast later chunks to it
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            else:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            n_rows += len(df_batch)
+    except BaseException:
+        # Do not leave the partial file behind, e.g. when a loan's months are out of order
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        raise
+
+    if writer is None:
+        raise ValueError(f"No repayments found in {actual_path}")
+    writer.close()
+    os.replace(tmp_path, output_path)
+    return n_rows
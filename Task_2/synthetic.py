@@ -0,0 +1,80 @@
+import argparse
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
+
+"""
+Synthetic loan book generator.
+
+Writes 'scheduled_loan_repayments.csv' and 'actual_loan_repayments.csv' shaped datasets of any size. The default
+rates follow the bundled data: loan amounts are whole thousands between 13,000 and 120,000, the scheduled repayment
+is the annuity payment of a 2 year loan at 10% a year, about 1.4% of repayments are missed and about 5% are
+double the scheduled repayment. The actual repayments are written month by month, so memory is bounded by the
+number of loans rather than the number of loan-months.
+
+"""
+
+
+def scheduled_repayment(loan_amount, annual_rate=0.1, term_months=24):
+    "function to calculate the monthly annuity repayment of a loan"
+    r_monthly = annual_rate / 12
+    return np.round(loan_amount * r_monthly / (1 - (1 + r_monthly)**-term_months), 2)
+
+
+def generate_loan_book(output_dir, n_loans=10_000, n_months=24, missed_rate=0.014, overpayment_rate=0.05,
+                       overpayment_factor=2.0, seed=None):
+    """
+        Generate a synthetic loan book and write it as csv files.
+
+        Args:
+            output_dir (str): Folder to write the two csv files to
+            n_loans (int): Number of loans
+            n_months (int): Number of months of actual repayments per loan
+            missed_rate (float): Share of repayments that are missed (paid as 0)
+            overpayment_rate (float): Share of repayments that are larger than scheduled
+            overpayment_factor (float): Multiple of the scheduled repayment paid on an overpayment
+            seed (int): Seed of the random number generator
+
+        Returns:
+            tuple: Paths of the scheduled and actual repayment csv files
+
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    scheduled_path = os.path.join(output_dir, 'scheduled_loan_repayments.csv')
+    actual_path = os.path.join(output_dir, 'actual_loan_repayments.csv')
+
+    # Scheduled repayments, one row per loan
+    loan_ids = np.arange(1, n_loans + 1, dtype=np.int32)
+    loan_amounts = rng.integers(13, 121, n_loans).astype(float) * 1000
+    scheduled = scheduled_repayment(loan_amounts)
+    pv.write_csv(pa.table({'LoanID': loan_ids, 'LoanAmount': loan_amounts, 'ScheduledRepayment': scheduled}),
+                 scheduled_path)
+
+    # Actual repayments, written one month at a time in chronological order like the bundled dataset
+    schema = pa.schema([('RepaymentID', pa.float64()), ('LoanID', pa.int32()), ('Month', pa.int16()),
+                        ('ActualRepayment', pa.float64())])
+    with pv.CSVWriter(actual_path, schema) as writer:
+        for month in range(1, n_months + 1):
+            event = rng.random(n_loans)
+            actual = np.where(event < missed_rate, 0.0,
+                              np.where(event < missed_rate + overpayment_rate, np.round(scheduled * overpayment_factor, 2),
+                                       scheduled))
+            repayment_ids = np.arange((month - 1) * n_loans + 1, month * n_loans + 1, dtype=float)
+            writer.write_table(pa.table({'RepaymentID': repayment_ids, 'LoanID': loan_ids,
+                                         'Month': np.full(n_loans, month, dtype=np.int16),
+                                         'ActualRepayment': actual}, schema=schema))
+
+    return scheduled_path, actual_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic loan book')
+    parser.add_argument('output_dir')
+    parser.add_argument('--loans', type=int, default=10_000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    print(*generate_loan_book(args.output_dir, args.loans, args.months, seed=args.seed), sep='\n')
@@ -0,0 +1,221 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import Python
+from duckdb_engine import DuckDBEngine
+from ledger import LoanLedger
+from parallel import calculate_df_balances_parallel
+from streaming import stream_df_balances
+
+"""
+Equivalence tests of the balance engines against the reference 'iterrows' loop of 'calculate_df_balances()'.
+
+"""
+
+
+def random_book(seed, n_loans=40, max_months=24):
+    """
+        Builds a small random loan book with ragged and gapped months, missed repayments and overpayments.
+
+        Args:
+            seed (int): Seed of the random generator
+            n_loans (int): Number of loans
+            max_months (int): Longest loan history
+
+        Returns:
+            tuple: 'df_scheduled' and 'df_actual' shaped Dataframes, the actual repayments in shuffled order
+
+    """
+
+    rng = np.random.default_rng(seed)
+    loan_amounts = rng.integers(13, 121, n_loans) * 1000.0
+    scheduled = (loan_amounts * (0.1 / 12) / (1 - (1 + 0.1 / 12) ** -24)).round(2)
+    df_scheduled = pd.DataFrame({'LoanID': np.arange(1, n_loans + 1), 'LoanAmount': loan_amounts,
+                                 'ScheduledRepayment': scheduled}).astype(Python.SCHEDULED_DTYPES)
+
+    rows = []
+    for loan_id, payment, amount in zip(df_scheduled['LoanID'], scheduled, loan_amounts):
+        # Ragged: every loan has its own number of months, gapped: some months are left out
+        months = np.arange(1, rng.integers(1, max_months + 1) + 1)
+        months = months[rng.random(len(months)) > 0.15] if len(months) > 1 else months
+        for month in months:
+            draw = rng.random()
+            if draw < 0.1:
+                repayment = 0.0
+            elif draw < 0.2:
+                repayment = payment * 2
+            elif draw < 0.25:
+                # Pays off more than the balance, so the balance is floored at zero
+                repayment = amount * 1.5
+            else:
+                repayment = payment
+            rows.append((loan_id, month, round(repayment, 2)))
+
+    df_actual = pd.DataFrame(rows, columns=['LoanID', 'Month', 'ActualRepayment'])
+    df_actual = df_actual.sample(frac=1, random_state=seed).reset_index(drop=True)
+    df_actual.insert(0, 'RepaymentID', np.arange(1, len(df_actual) + 1, dtype=float))
+    return df_scheduled, df_actual.astype(Python.ACTUAL_DTYPES)
+
+
+def assert_engines_equal(df_scheduled, df_actual):
+    "function to check that both balance engines give the same 'df_balances'"
+    expected = Python.calculate_df_balances(df_scheduled.copy(), df_actual.copy(), engine='iterrows')
+    result = Python.calculate_df_balances(df_scheduled.copy(), df_actual.copy(), engine='vectorized')
+    assert_frame_equal(result, expected)
+
+
+def test_bundled_data():
+    loader = Python.LoanDataLoader()
+    assert_engines_equal(loader.df_scheduled, loader.df_actual)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_book(seed):
+    df_scheduled, df_actual = random_book(seed)
+    assert_engines_equal(df_scheduled, df_actual)
+
+
+def test_random_book_hits_zero_floor():
+    df_scheduled, df_actual = random_book(0)
+    df_balances = Python.calculate_df_balances(df_scheduled, df_actual, engine='vectorized')
+    assert (df_balances['LoanBalanceEnd'] == 0).any()
+    assert (df_balances['ActualRepayment'] > df_balances['LoanBalanceStart']).any()
+
+
+def test_unknown_engine():
+    df_scheduled, df_actual = random_book(0, n_loans=2)
+    with pytest.raises(ValueError):
+        Python.calculate_df_balances(df_scheduled, df_actual, engine='loop')
+
+
+def write_book(folder, df_scheduled, df_actual):
+    "function to write a loan book to the two csv files, returning their paths"
+    scheduled_path = str(folder / 'scheduled_loan_repayments.csv')
+    actual_path = str(folder / 'actual_loan_repayments.csv')
+    df_scheduled.to_csv(scheduled_path, index=False)
+    df_actual.to_csv(actual_path, index=False)
+    return scheduled_path, actual_path
+
+
+def assert_duckdb_engine_equal(engine, df_scheduled, df_actual):
+    "function to check the DuckDB engine against 'calculate_df_balances()' and the question functions"
+    expected = Python.calculate_df_balances(df_scheduled.copy(), df_actual.copy())
+    assert_frame_equal(engine.df_balances(), expected)
+    # NaN results, e.g. the CPR of a book whose balances all reach zero in a month, must match as well
+    np.testing.assert_equal([engine.question_1(), engine.question_2(), engine.question_3(), engine.question_4()],
+                            [Python.question_1(expected), Python.question_2(expected), Python.question_3(expected),
+                             Python.question_4(expected)])
+
+
+def test_duckdb_engine_bundled_data():
+    loader = Python.LoanDataLoader()
+    with DuckDBEngine() as engine:
+        assert_duckdb_engine_equal(engine, loader.df_scheduled, loader.df_actual)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_duckdb_engine_random_book(seed, tmp_path):
+    df_scheduled, df_actual = random_book(seed)
+    with DuckDBEngine(*write_book(tmp_path, df_scheduled, df_actual)) as engine:
+        assert_duckdb_engine_equal(engine, df_scheduled, df_actual)
+
+
+def test_duckdb_engine_parquet_folder(tmp_path):
+    df_scheduled, df_actual = random_book(0)
+    scheduled_path, actual_path = write_book(tmp_path, df_scheduled, df_actual)
+    folder = tmp_path / 'actual'
+    for month, df_month in df_actual.groupby('Month'):
+        os.makedirs(folder / f'Month={month}')
+        df_month.to_parquet(folder / f'Month={month}' / 'part-0.parquet', index=False)
+    with DuckDBEngine(scheduled_path, str(folder)) as engine:
+        assert_duckdb_engine_equal(engine, df_scheduled, df_actual)
+
+
+def test_expected_loss_grid_missing_horizon():
+    metrics = Python.PortfolioMetrics(Python.LoanDataLoader().df_balances)
+    assert len(metrics.expected_loss_grid(horizons=(6, 12))) == 2 * len(metrics.expected_loss_grid(horizons=(12,)))
+    with pytest.raises(ValueError, match=r'\[13, 24\]'):
+        metrics.expected_loss_grid(horizons=(12, 13, 24))
+
+
+def assert_ledger_equal(df_scheduled, batches):
+    "function to check that appending the batches to a 'LoanLedger' reproduces 'calculate_df_balances()'"
+    ledger = LoanLedger(df_scheduled)
+    for df_batch in batches:
+        ledger.append(df_batch)
+    expected = Python.calculate_df_balances(df_scheduled.copy(), pd.concat(batches, ignore_index=True))
+    assert_frame_equal(ledger.df_balances, expected)
+
+
+def test_ledger_bundled_data_month_by_month():
+    loader = Python.LoanDataLoader()
+    assert_ledger_equal(loader.df_scheduled, [df_month for _, df_month in loader.df_actual.groupby('Month')])
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_ledger_random_book_batches(seed):
+    df_scheduled, df_actual = random_book(seed)
+    # Uneven batches of months, each batch in the shuffled order of 'random_book()'
+    edges = [0, 1, 4, 5, 11, 18, 24]
+    assert_ledger_equal(df_scheduled, [df_actual[(df_actual['Month'] > start) & (df_actual['Month'] <= end)]
+                                       for start, end in zip(edges, edges[1:])])
+
+
+def test_ledger_rejects_stale_months_and_unknown_loans():
+    df_scheduled, df_actual = random_book(0, n_loans=5)
+    ledger = LoanLedger(df_scheduled)
+    ledger.append(df_actual[df_actual['Month'] <= 3])
+    state = ledger.state
+
+    for month in (3, 2):
+        df_stale = df_actual[df_actual['Month'] <= 3].assign(Month=month)
+        with pytest.raises(ValueError, match='months after'):
+            ledger.append(df_stale)
+
+    df_unknown = df_actual[df_actual['Month'] == 4].assign(LoanID=99)
+    with pytest.raises(ValueError, match=r'\[99\]'):
+        ledger.append(df_unknown)
+
+    # A rejected batch leaves the ledger as it was
+    assert_frame_equal(ledger.state, state)
+
+
+@pytest.mark.parametrize('order', [['LoanID', 'Month'], ['Month', 'LoanID']])
+@pytest.mark.parametrize('seed', range(2))
+def test_stream_df_balances(seed, order, tmp_path):
+    df_scheduled, df_actual = random_book(seed)
+    df_actual = df_actual.sort_values(order).reset_index(drop=True)
+    scheduled_path, actual_path = write_book(tmp_path, df_scheduled, df_actual)
+    output_path = str(tmp_path / 'df_balances.parquet')
+
+    # An odd chunk size splits the months of most loans across chunks
+    assert stream_df_balances(scheduled_path, actual_path, output_path, chunksize=7) == len(df_actual)
+    result = pd.read_parquet(output_path).sort_values(['LoanID', 'Month']).reset_index(drop=True)
+    assert_frame_equal(result, Python.calculate_df_balances(df_scheduled, df_actual))
+
+
+def test_stream_df_balances_out_of_order(tmp_path):
+    df_scheduled, df_actual = random_book(0)
+    df_actual = df_actual.sort_values(['Month', 'LoanID']).reset_index(drop=True)
+    # Move the first repayment of the longest loan to the end of the file, after the later months of that loan
+    first = df_actual['LoanID'].eq(df_actual.groupby('LoanID')['Month'].max().idxmax()).idxmax()
+    df_actual = pd.concat([df_actual.drop(index=first), df_actual.loc[[first]]], ignore_index=True)
+    scheduled_path, actual_path = write_book(tmp_path, df_scheduled, df_actual)
+    output_path = str(tmp_path / 'df_balances.parquet')
+
+    with pytest.raises(ValueError, match='months after'):
+        stream_df_balances(scheduled_path, actual_path, output_path, chunksize=7)
+    assert not os.path.exists(output_path + '.tmp')
+    assert not os.path.exists(output_path)
+
+
+@pytest.mark.parametrize('seed', range(2))
+def test_parallel_shared_memory(seed):
+    df_scheduled, df_actual = random_book(seed)
+    # More shards than workers goes through the shared memory and process pool path
+    result = calculate_df_balances_parallel(df_scheduled, df_actual, workers=2, n_shards=3)
+    assert_frame_equal(result, Python.calculate_df_balances(df_scheduled, df_actual))